@@ -0,0 +1,282 @@
+import hashlib
+import dateutil.parser
+from flask import Blueprint, current_app, request, jsonify, abort
+from models import db, Venue, Artist, Show
+from pagination import keyset_page, cursor_arg
+import matchmaking
+import geo
+
+#----------------------------------------------------------------------------#
+# JSON API.
+#
+# Read-only, versioned JSON views of venues, artists and shows under /api/v1.
+#
+#   * ?fields=name,city selects the fields returned (id is always included);
+#     only those columns are queried, and the joins of show fields are only
+#     made when one of the venue_* / artist_* fields is asked for.
+#   * Lists are paginated with keyset cursors (?after= / ?before=, ?limit=).
+#   * Every response carries a strong ETag computed from the version columns
+#     of the rows it is built from, so a request with a matching
+#     If-None-Match is answered 304 without serializing anything.
+#
+# /venues/<id>/recommended-artists and /artists/<id>/recommended-venues
+# return the best matches of matchmaking.py with their score, and
+# /venues/near the venues around a point (geo.py) with their distance.
+#----------------------------------------------------------------------------#
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+class Resource(object):
+  """Fields and pagination key of one kind of API object"""
+
+  def __init__(self, model, fields, default_fields, order, parsers, joins=None):
+    self.model = model
+    self.fields = fields
+    self.default_fields = default_fields
+    self.order = order
+    self.parsers = parsers
+    self.joins = joins or {}
+
+  def columns(self, names):
+    """Return the labelled columns of names and of the sort key, the version
+    columns of every table they come from and the tables to join"""
+    columns = [self.fields[name].label(name) for name in names]
+    columns += [column.label('_order_%d' % i) for i, column in enumerate(self.order)]
+    versions = [self.model.version.label('_version')]
+    joins = []
+    for joined, onclause in self.joins.items():
+      if any(self.fields[name].class_ is joined for name in names):
+        joins.append((joined, onclause))
+        versions.append(joined.version.label('_version_%s' % joined.__tablename__))
+    return columns, versions, joins
+
+  def query(self, names):
+    columns, versions, joins = self.columns(names)
+    query = db.session.query(*(columns + versions))
+    for joined, onclause in joins:
+      query = query.join(joined, onclause)
+    return query
+
+
+def _entity_fields(model, names):
+  return dict((name, getattr(model, name)) for name in names)
+
+
+ENTITY_FIELDS = (
+  'id', 'name', 'city', 'state', 'phone', 'genres', 'website', 'facebook_link',
+  'seeking_description', 'image_link', 'past_shows_count', 'upcoming_shows_count'
+)
+
+VENUES = Resource(
+  Venue,
+  _entity_fields(Venue, ENTITY_FIELDS + ('address', 'seeking_talent', 'latitude', 'longitude')),
+  default_fields=('id', 'name', 'city', 'state'),
+  order=(Venue.id,),
+  parsers=(int,)
+)
+ARTISTS = Resource(
+  Artist,
+  _entity_fields(Artist, ENTITY_FIELDS + ('seeking_venue',)),
+  default_fields=('id', 'name', 'city', 'state'),
+  order=(Artist.id,),
+  parsers=(int,)
+)
+SHOWS = Resource(
+  Show,
+  {
+    'id': Show.id,
+    'start_time': Show.start_time,
+    'end_time': Show.end_time,
+    'venue_id': Show.venue_id,
+    'venue_name': Venue.name,
+    'venue_image_link': Venue.image_link,
+    'artist_id': Show.artist_id,
+    'artist_name': Artist.name,
+    'artist_image_link': Artist.image_link
+  },
+  default_fields=('id', 'start_time', 'venue_id', 'venue_name', 'artist_id', 'artist_name', 'artist_image_link'),
+  order=(Show.start_time, Show.id),
+  parsers=(dateutil.parser.parse, int),
+  joins={Venue: Show.venue_id == Venue.id, Artist: Show.artist_id == Artist.id}
+)
+
+
+def _requested_fields(resource, default):
+  """Return the field names asked for with ?fields=, id first"""
+  requested = request.args.get('fields')
+  if not requested:
+    return list(default)
+  names = []
+  for name in requested.split(','):
+    name = name.strip()
+    if not name or name in names:
+      continue
+    if name not in resource.fields:
+      abort(400, 'Unknown field: {}. Available fields: {}.'.format(name, ', '.join(sorted(resource.fields))))
+    names.append(name)
+  return ['id'] + [name for name in names if name != 'id']
+
+
+def _versions(row):
+  return tuple(value for key, value in zip(row.keys(), row) if key.startswith('_version'))
+
+
+def _serialize(row, names):
+  item = {}
+  for name in names:
+    value = getattr(row, name)
+    if hasattr(value, 'isoformat'):
+      value = value.isoformat()
+    item[name] = value
+  return item
+
+
+def _etag(*parts):
+  return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def _respond(etag, build):
+  """Answer 304 when the client has etag, else the JSON returned by build()"""
+  if request.if_none_match.contains(etag):
+    response = current_app.response_class(status=304)
+  else:
+    response = jsonify(build())
+  response.set_etag(etag)
+  response.cache_control.no_cache = True
+  return response
+
+
+def _list(resource, filters=()):
+  names = _requested_fields(resource, resource.default_fields)
+  limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int)
+  limit = max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+  query = resource.query(names)
+  for criterion in filters:
+    query = query.filter(criterion)
+  page = keyset_page(
+    query,
+    columns=resource.order,
+    key=lambda row: tuple(getattr(row, '_order_%d' % i) for i in range(len(resource.order))),
+    per_page=limit,
+    after=cursor_arg('after', *resource.parsers),
+    before=cursor_arg('before', *resource.parsers)
+  )
+  etag = _etag(names, [(row.id,) + _versions(row) for row in page.items], page.prev_cursor, page.next_cursor)
+  return _respond(etag, lambda: {
+    'data': [_serialize(row, names) for row in page.items],
+    'prev_cursor': page.prev_cursor,
+    'next_cursor': page.next_cursor
+  })
+
+
+def _detail(resource, entity_id):
+  names = _requested_fields(resource, sorted(resource.fields))
+  row = resource.query(names).filter(resource.model.id == entity_id).first()
+  if row is None:
+    abort(404, '{} {} not found.'.format(resource.model.__tablename__, entity_id))
+  return _respond(_etag(names, _versions(row)), lambda: _serialize(row, names))
+
+
+def _recommended(resource, model, entity_id):
+  """The resource objects recommended for entity_id of model, best first"""
+  names = _requested_fields(resource, resource.default_fields + ('genres', 'image_link'))
+  limit = request.args.get('limit', current_app.config['MATCH_LIMIT'], type=int)
+  limit = max(1, min(limit, current_app.config['MATCH_MAX_LIMIT']))
+  matches = matchmaking.get_matchmaker().recommend(model, entity_id, limit)
+  if matches is None:
+    abort(404, '{} {} not found.'.format(model.__tablename__, entity_id))
+  return _ranked(resource, names, matches, 'score')
+
+
+def _ranked(resource, names, ranked, key):
+  """Respond with the objects of the (id, value) pairs ranked, in that
+  order, their value added as key"""
+  rows = {}
+  if ranked:
+    query = resource.query(names).filter(resource.model.id.in_([entity_id for entity_id, _ in ranked]))
+    rows = dict((row.id, row) for row in query)
+  ranked = [(rows[entity_id], value) for entity_id, value in ranked if entity_id in rows]
+  etag = _etag(names, [(row.id,) + _versions(row) + (value,) for row, value in ranked])
+  return _respond(etag, lambda: {
+    'data': [dict(_serialize(row, names), **{key: value}) for row, value in ranked]
+  })
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def api_error(error):
+  return jsonify({'error': error.description}), error.code
+
+
+@api.route('/venues')
+def venues():
+  return _list(VENUES)
+
+
+@api.route('/venues/near')
+def venues_near():
+  """Venues around ?lat=&lon= or the venues of ?city=&state=, nearest first;
+  within ?radius_km= when given, else the ?limit= nearest"""
+  latitude = request.args.get('lat', type=float)
+  longitude = request.args.get('lon', type=float)
+  if latitude is None or longitude is None:
+    if not request.args.get('city'):
+      abort(400, 'Give either lat and lon or city and state.')
+    position = geo.geocode(request.args.get('city'), request.args.get('state'))
+    if position is None:
+      abort(404, 'Unknown city: {}, {}.'.format(request.args.get('city'), request.args.get('state')))
+    latitude, longitude = position
+  if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+    abort(400, 'lat must be between -90 and 90 and lon between -180 and 180.')
+  radius_km = request.args.get('radius_km', type=float)
+  if radius_km is not None and radius_km <= 0:
+    abort(400, 'radius_km must be positive.')
+  limit = request.args.get('limit', current_app.config['NEAR_LIMIT'], type=int)
+  limit = max(1, min(limit, current_app.config['NEAR_MAX_LIMIT']))
+  names = _requested_fields(VENUES, VENUES.default_fields + ('address',))
+  near = geo.get_backend().near(latitude, longitude, radius_km, limit)
+  return _ranked(VENUES, names, [(venue_id, round(distance, 3)) for venue_id, distance in near], 'distance_km')
+
+
+@api.route('/venues/<int:venue_id>')
+def venue(venue_id):
+  return _detail(VENUES, venue_id)
+
+
+@api.route('/venues/<int:venue_id>/recommended-artists')
+def recommended_artists(venue_id):
+  return _recommended(ARTISTS, Venue, venue_id)
+
+
+@api.route('/artists')
+def artists():
+  return _list(ARTISTS)
+
+
+@api.route('/artists/<int:artist_id>')
+def artist(artist_id):
+  return _detail(ARTISTS, artist_id)
+
+
+@api.route('/artists/<int:artist_id>/recommended-venues')
+def recommended_venues(artist_id):
+  return _recommended(VENUES, Artist, artist_id)
+
+
+@api.route('/shows')
+def shows():
+  """Shows ordered by start time, optionally of one ?venue_id= or ?artist_id="""
+  filters = []
+  venue_id = request.args.get('venue_id', type=int)
+  if venue_id is not None:
+    filters.append(Show.venue_id == venue_id)
+  artist_id = request.args.get('artist_id', type=int)
+  if artist_id is not None:
+    filters.append(Show.artist_id == artist_id)
+  return _list(SHOWS, filters)
+
+
+@api.route('/shows/<int:show_id>')
+def show(show_id):
+  return _detail(SHOWS, show_id)
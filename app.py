@@ -4,18 +4,39 @@
 
 import json
 import dateutil.parser
-import babel
 import logging
 import sys
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify
+import hmac
+from itertools import groupby
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, abort, stream_with_context
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from flask_migrate import Migrate
-from datetime import datetime, date
-from models import db, Venue, Artist, Show
+from sqlalchemy.exc import IntegrityError
+from models import db, Venue, Artist, Show, Location, AREA_STATE, AREA_CITY
+from pagination import keyset_page, cursor_arg
+from commands import fyyur_cli
+import counters
+import conflicts
+import search
+import genres
+import matchmaking
+import geo
+import locations
+import concurrency
+import typeahead
+from cache import cached_page, invalidate
+import latest
+import metrics
+import exporter
+from formatting import format_datetime
+import templating
+import assets
+import booking
+from api import api
 
 #----------------------------------------------------------------------------#
 # App Config.
@@ -24,60 +45,93 @@ from models import db, Venue, Artist, Show
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
+metrics.init_app(app)
 db.init_app(app)
 
 migrate = Migrate(app, db)
+app.cli.add_command(fyyur_cli)
+app.register_blueprint(api)
+assets.init_app(app)
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
-
+# Parsed patterns and formatted strings are cached, see formatting.py
 app.jinja_env.filters['datetime'] = format_datetime
 
+# Bytecode cache and warm up; after the filters, which templates compile against
+templating.init_app(app)
+
+#----------------------------------------------------------------------------#
+# Hooks.
+#----------------------------------------------------------------------------#
+
+def venue_changed(venue_id, artist_ids=None):
+  """Propagate a created, edited or deleted venue to the derived indexes and caches
+  
+  artist_ids are the artists with shows at the venue, whose pages show its
+  name; they are looked up when not given. A deleted venue has no shows
+  left: pass [] and the removed shows to shows_changed().
+  """
+  search.get_backend().refresh(Venue, venue_id)
+  genres.get_backend().refresh(Venue, venue_id)
+  matchmaking.get_matchmaker().refresh(Venue, venue_id)
+  geo.get_backend().refresh(venue_id)
+  typeahead.get_typeahead().refresh(Venue, venue_id)
+  latest.get_feed(Venue).refresh(venue_id)
+  if artist_ids is None:
+    artist_ids=[artist_id for artist_id, in db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
+  invalidate('home', 'venues', 'shows', 'venue:%d' % venue_id, *['artist:%d' % artist_id for artist_id in artist_ids])
+
+def artist_changed(artist_id, venue_ids=None):
+  """Propagate a created, edited or deleted artist to the derived indexes and caches
+  
+  venue_ids are the venues the artist played at, whose pages show its name;
+  they are looked up when not given.
+  """
+  search.get_backend().refresh(Artist, artist_id)
+  genres.get_backend().refresh(Artist, artist_id)
+  matchmaking.get_matchmaker().refresh(Artist, artist_id)
+  typeahead.get_typeahead().refresh(Artist, artist_id)
+  latest.get_feed(Artist).refresh(artist_id)
+  if venue_ids is None:
+    venue_ids=[venue_id for venue_id, in db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()]
+  invalidate('home', 'artists', 'shows', 'artist:%d' % artist_id, *['venue:%d' % venue_id for venue_id in venue_ids])
+
+def shows_changed(shows):
+  """Propagate created or deleted (venue_id, artist_id) shows to the caches"""
+  matchmaking.get_matchmaker().refresh_history(shows)
+  namespaces=set(['shows', 'venues', 'artists'])
+  for venue_id, artist_id in shows:
+    namespaces.add('venue:%d' % venue_id)
+    namespaces.add('artist:%d' % artist_id)
+  invalidate(*namespaces)
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
 @app.route('/')
+@cached_page(lambda: ['home'])
 def index():
-  """Return top 10 recently created venues"""
-  latest_venues=Venue.query.filter(Venue.timestamp.isnot(None)).order_by(Venue.timestamp.desc()).limit(10)
-  """Return top 10 recently created artists"""
-  latest_artists=Artist.query.filter(Artist.timestamp.isnot(None)).order_by(Artist.timestamp.desc()).limit(10)
-
-  """Check if the results are empty. If so set the display property to false
+  """Return the recently created venues and artists
   
-  This will prevent frontend to render empty Artists or Venues section
+  Both feeds are small in-memory rings kept current on insert (see
+  latest.py), so the home page runs no queries once they are loaded; when
+  they are (re)loaded the two queries run concurrently, see concurrency.py.
+  The display property is false for an empty feed, which prevents the
+  frontend from rendering an empty Artists or Venues section.
   """
-  if len(latest_venues.all()) == 0:
-    latest_venues_data={
-      "display": False,
-      "list": latest_venues
-    }
-  else:
-    latest_venues_data={
-      "display": True,
-      "list": latest_venues
-    }
-  
-  if len(latest_artists.all()) == 0:
-    latest_artists_data={
-      "display": False,
-      "list": latest_artists
-    }
-  else:
-    latest_artists_data={
-      "display": True,
-      "list": latest_artists
-    }
+  latest_venues, latest_artists=concurrency.gather(latest.get_feed(Venue).items, latest.get_feed(Artist).items)
+  latest_venues_data={
+    "display": len(latest_venues) > 0,
+    "list": latest_venues
+  }
+  latest_artists_data={
+    "display": len(latest_artists) > 0,
+    "list": latest_artists
+  }
   return render_template('pages/home.html', venues=latest_venues_data, artists=latest_artists_data)
 
 
@@ -85,27 +139,51 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@cached_page(lambda: ['venues'])
 def venues():
-  """Dynamically create the areas list"""
+  """List venues grouped by area (city, state)
+  
+  Areas are grouped, counted and paginated by the database with a keyset on
+  (state, city), NULLs coalesced to '' so that the keyset comparisons see
+  every area; the ix_Venue_area index on the same expressions serves the
+  seek and the grouping. The venues of the areas on this page are then
+  streamed in the same order and bucketed by area with itertools.groupby,
+  one pass and no nested loops.
+  ?genre= narrows both queries to venues with any (or, with ?match=all, all)
+  of the given genres, see genres.py.
+  """
+  selected, match=genres.requested(request.args)
+  genre_filter=genres.get_backend().criterion(Venue, selected, match) if selected else db.true()
+  state=AREA_STATE
+  city=AREA_CITY
+  area_query=db.session.query(
+    state.label('state'),
+    city.label('city'),
+    db.func.count(Venue.id).label('venue_count')
+  ).filter(genre_filter).group_by(state, city)
+  page=keyset_page(
+    area_query,
+    columns=(state, city),
+    key=lambda area: (area.state, area.city),
+    per_page=app.config['AREAS_PER_PAGE'],
+    after=cursor_arg('after', str, str),
+    before=cursor_arg('before', str, str)
+  )
   areas=[]
-  venues=Venue.query.all()
-  for venue in venues:
-    inserted=False
-    for area in areas:
-      if area["city"] == venue.city and area["state"] == venue.state:
-        area["venues"].append(venue)
-        inserted=True
-    if not inserted or len(areas) == 0:
-      area = {
-        "city": None,
-        "state": None,
-        "venues": []
-      }
-      area["city"]=venue.city
-      area["state"]=venue.state
-      area["venues"].append(venue)
-      areas.append(area)
-  return render_template('pages/venues.html', areas=areas)
+  if page.items:
+    venue_rows=db.session.query(Venue.id, Venue.name, state.label('state'), city.label('city'), Venue.upcoming_shows_count).filter(
+      db.or_(*[db.and_(state == area.state, city == area.city) for area in page.items])
+    ).filter(genre_filter).order_by(state, city, Venue.name).yield_per(500)
+    grouped=dict((area, list(area_venues)) for area, area_venues in groupby(venue_rows, key=lambda venue: (venue.state, venue.city)))
+    for area in page.items:
+      areas.append({
+        "city": area.city,
+        "state": area.state,
+        "venue_count": area.venue_count,
+        "venues": grouped.get((area.state, area.city), [])
+      })
+  facets=genres.facet_counts(Venue, 'venues')
+  return render_template('pages/venues.html', areas=areas, page=page, facets=facets, selected=selected, match=match)
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
@@ -117,18 +195,13 @@ def search_venues():
   """
   search_term=request.form.get('search_term', '')
   
-  if search_term.find(',') != -1:
-    city=search_term.split(', ')[0]
-    state=search_term.split(', ')[1].upper()
-    if city.find(' '):
-      city_word_list = []
-      for word in city.split(' '):
-        city_word_list.append(word.capitalize())
-      city=' '.join(city_word_list)
-    search_term=city + ', ' + state
-    data=Venue.query.filter_by(city=city, state=state).all()
+  location_key=locations.parse(search_term)
+  if location_key is not None:
+    """Case and whitespace insensitive lookup on the Location key, see locations.py"""
+    data=Venue.query.join(Location, Venue.location_id == Location.id).filter(Location.key == location_key).all()
   else:
-    data=Venue.query.filter(Venue.name.ilike('%' + search_term + '%')).all()
+    """Ranked name, city and genre search, see search.py"""
+    data=search.get_backend().search(Venue, search_term, limit=app.config['SEARCH_RESULT_LIMIT'])
   
   response={
     "count": len(data),
@@ -137,32 +210,32 @@ def search_venues():
   return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 @app.route('/venues/<int:venue_id>')
+@cached_page(lambda venue_id: ['venue:%d' % venue_id])
 def show_venue(venue_id):
   """Show the venue page with the given venue_id
   
   Retrieve venue data from the venues table, using venue_id
   """
-  venue=Venue.query.filter_by(id=venue_id).first()
-  venue.past_shows=[]
-  venue.upcoming_shows=[]
-  """Get all shows in this venue"""
-  shows=Show.query.filter_by(venue_id=venue_id).order_by('start_time').all()
-  """Get current date without microseconds"""
-  today=datetime.now().replace(microsecond=0)
-  """Loop through the shows to find out whther they are past or future"""
-  for show in shows:
-    artist=Artist.query.get(show.artist_id)
-    show.artist_name=artist.name
-    show.artist_image_link=artist.image_link
-    show_time = datetime.strptime(show.start_time,"%Y-%m-%d %H:%M:%S")
-    if today >= show_time:
-      venue.past_shows.append(show)
-    else:
-      venue.upcoming_shows.append(show)
-  """Set the number of past and upcoming shows"""
-  venue.past_shows_count=len(venue.past_shows)
-  venue.upcoming_shows_count=len(venue.upcoming_shows)
-  return render_template('pages/show_venue.html', venue=venue)
+  def venue_shows(upcoming):
+    """Get the shows in this venue along with their artists
+    
+    Past and upcoming shows are split by the database, using the
+    (venue_id, start_time) index.
+    """
+    started=Show.start_time >= db.func.now() if upcoming else Show.start_time < db.func.now()
+    return Show.query.options(db.joinedload(Show.artist)).filter(Show.venue_id == venue_id, started).order_by(Show.start_time).all()
+  """The venue and its shows are independent queries, run concurrently"""
+  venue, past_shows, upcoming_shows=concurrency.gather(
+    lambda: Venue.query.get_or_404(venue_id),
+    lambda: venue_shows(False),
+    lambda: venue_shows(True)
+  )
+  venue.past_shows=past_shows
+  venue.upcoming_shows=upcoming_shows
+  """The numbers of past and upcoming shows of the page are passed apart:
+  assigned to the counter columns they would be flushed over the counters"""
+  return render_template('pages/show_venue.html', venue=venue,
+    past_shows_count=len(past_shows), upcoming_shows_count=len(upcoming_shows))
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -188,9 +261,11 @@ def create_venue_submission():
     "facebook_link": request.form.get("facebook_link")
   }
   try:
-    venue=Venue(name=new_venue["name"], city=new_venue["city"], state=new_venue["state"], address=new_venue["address"], phone=new_venue["phone"], genres=new_venue["genres"], facebook_link=new_venue["facebook_link"])
+    latitude, longitude=geo.geocode(new_venue["city"], new_venue["state"]) or (None, None)
+    venue=Venue(name=new_venue["name"], city=new_venue["city"], state=new_venue["state"], address=new_venue["address"], phone=new_venue["phone"], genres=new_venue["genres"], facebook_link=new_venue["facebook_link"], latitude=latitude, longitude=longitude, location_id=locations.get_location_id(new_venue["city"], new_venue["state"]))
     db.session.add(venue)
     db.session.commit()
+    venue_id=venue.id
   except:
     error=True
     db.session.rollback()
@@ -203,25 +278,35 @@ def create_venue_submission():
     return render_template('errors/500.html')
   else:
     """On successful db insert, flash success"""
+    venue_changed(venue_id)
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
     return redirect(url_for('index'))
 
 #  Delete Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@app.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   """Delete a venue"""
+  error=False
   try:
     venue=Venue.query.get(venue_id)
+    """The venue's shows are deleted with it, take them off the artists' counters"""
+    counters.shows_removed(venue.shows)
+    removed=set((show.venue_id, show.artist_id) for show in venue.shows)
     db.session.delete(venue)
     db.session.commit()
   except:
+    error=True
     db.session.rollback()
     print(sys.exc_info())
   finally:
     db.session.close()
-  return None
+  if not error:
+    venue_changed(venue_id, [])
+    """The listing of the artists shows their counters, which changed too"""
+    shows_changed(removed)
+  return jsonify({'success': not error})
 
 #  Update Venue
 #  ----------------------------------------------------------------
@@ -247,7 +332,12 @@ def edit_venue_submission(venue_id):
   """Update existing venue record with ID <venue_id> using the new attributes"""
   error=False
   try:
-    Venue.query.filter_by(id=venue_id).update(request.form)
+    values=request.form.to_dict()
+    values['genres']=request.form.getlist('genres')
+    values['latitude'], values['longitude']=geo.geocode(values.get('city'), values.get('state')) or (None, None)
+    values['location_id']=locations.get_location_id(values.get('city'), values.get('state'))
+    values['version']=Venue.version + 1
+    Venue.query.filter_by(id=venue_id).update(values, synchronize_session=False)
     db.session.commit()
   except:
     error=True
@@ -261,17 +351,24 @@ def edit_venue_submission(venue_id):
     render_template('errors/500.html')
   else:
     # On successful db insert, flash success
+    venue_changed(venue_id)
     flash('Venue ' + request.form['name'] + ' info was successfully updated!')
-    return render_template('pages/home.html')
   return redirect(url_for('show_venue', venue_id=venue_id))
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@cached_page(lambda: ['artists'])
 def artists():
-  """Display all artist"""
-  artists=Artist.query.all()
-  return render_template('pages/artists.html', artists=artists)
+  """Display all artist along with their maintained show counters, narrowed by ?genre= like /venues"""
+  selected, match=genres.requested(request.args)
+  def artist_rows():
+    query=db.session.query(Artist.id, Artist.name, Artist.upcoming_shows_count, Artist.past_shows_count)
+    if selected:
+      query=query.filter(genres.get_backend().criterion(Artist, selected, match))
+    return query.order_by(Artist.name).all()
+  artists, facets=concurrency.gather(artist_rows, lambda: genres.facet_counts(Artist, 'artists'))
+  return render_template('pages/artists.html', artists=artists, facets=facets, selected=selected, match=match)
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
@@ -283,18 +380,13 @@ def search_artists():
   """
   search_term=request.form.get('search_term', '')
 
-  if search_term.find(',') != -1:
-    city=search_term.split(', ')[0]
-    state=search_term.split(', ')[1].upper()
-    if city.find(' '):
-      city_word_list = []
-      for word in city.split(' '):
-        city_word_list.append(word.capitalize())
-      city=' '.join(city_word_list)
-    search_term=city + ', ' + state
-    data=Artist.query.filter_by(city=city, state=state).all()
+  location_key=locations.parse(search_term)
+  if location_key is not None:
+    """Case and whitespace insensitive lookup on the Location key, see locations.py"""
+    data=Artist.query.join(Location, Artist.location_id == Location.id).filter(Location.key == location_key).all()
   else:
-    data=Artist.query.filter(Artist.name.ilike('%' + search_term + '%')).all()
+    """Ranked name, city and genre search, see search.py"""
+    data=search.get_backend().search(Artist, search_term, limit=app.config['SEARCH_RESULT_LIMIT'])
   
   response={
     "count": len(data),
@@ -303,29 +395,29 @@ def search_artists():
   return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 @app.route('/artists/<int:artist_id>')
+@cached_page(lambda artist_id: ['artist:%d' % artist_id])
 def show_artist(artist_id):
   """Show the artist page with the given artist_id"""
-  artist=Artist.query.filter_by(id=artist_id).first()
-  artist.past_shows=[]
-  artist.upcoming_shows=[]
-  """Get all shows for this artist"""
-  shows=Show.query.filter_by(artist_id=artist_id).order_by('start_time').all()
-  """Get current date"""
-  today=datetime.now().replace(microsecond=0)
-  """Loop through the shows to find out whther they are past or future"""
-  for show in shows:
-    venue=Venue.query.get(show.venue_id)
-    show.venue_name=venue.name
-    show.venue_image_link=venue.image_link
-    show_time = datetime.strptime(show.start_time,"%Y-%m-%d %H:%M:%S")
-    if today >= show_time:
-      artist.past_shows.append(show)
-    else:
-      artist.upcoming_shows.append(show)
-  """Set the number of past and upcoming shows"""
-  artist.past_shows_count=len(artist.past_shows)
-  artist.upcoming_shows_count=len(artist.upcoming_shows)
-  return render_template('pages/show_artist.html', artist=artist)
+  def artist_shows(upcoming):
+    """Get the shows of this artist along with their venues
+    
+    Past and upcoming shows are split by the database, using the
+    (artist_id, start_time) index.
+    """
+    started=Show.start_time >= db.func.now() if upcoming else Show.start_time < db.func.now()
+    return Show.query.options(db.joinedload(Show.venue)).filter(Show.artist_id == artist_id, started).order_by(Show.start_time).all()
+  """The artist and its shows are independent queries, run concurrently"""
+  artist, past_shows, upcoming_shows=concurrency.gather(
+    lambda: Artist.query.get_or_404(artist_id),
+    lambda: artist_shows(False),
+    lambda: artist_shows(True)
+  )
+  artist.past_shows=past_shows
+  artist.upcoming_shows=upcoming_shows
+  """The numbers of past and upcoming shows of the page are passed apart:
+  assigned to the counter columns they would be flushed over the counters"""
+  return render_template('pages/show_artist.html', artist=artist,
+    past_shows_count=len(past_shows), upcoming_shows_count=len(upcoming_shows))
 
 #  Update Artist
 #  ----------------------------------------------------------------
@@ -349,7 +441,11 @@ def edit_artist_submission(artist_id):
   """Update existing artist record with ID <artist_id> using the new attributes."""
   error=False
   try:
-    Artist.query.filter_by(id=artist_id).update(request.form)
+    values=request.form.to_dict()
+    values['genres']=request.form.getlist('genres')
+    values['location_id']=locations.get_location_id(values.get('city'), values.get('state'))
+    values['version']=Artist.version + 1
+    Artist.query.filter_by(id=artist_id).update(values, synchronize_session=False)
     db.session.commit()
   except:
     error=True
@@ -363,8 +459,8 @@ def edit_artist_submission(artist_id):
     render_template('errors/500.html')
   else:
     """On successful db insert, flash success."""
+    artist_changed(artist_id)
     flash('Artist ' + request.form['name'] + ' info was successfully updated!')
-    return render_template('pages/home.html')
   return redirect(url_for('show_artist', artist_id=artist_id))
 
 #  Create Artist
@@ -390,9 +486,10 @@ def create_artist_submission():
     "facebook_link": request.form.get("facebook_link")
   }
   try:
-    artist=Artist(name=new_artist["name"], city=new_artist["city"], state=new_artist["state"], phone=new_artist["phone"], genres=new_artist["genres"], facebook_link=new_artist["facebook_link"])
+    artist=Artist(name=new_artist["name"], city=new_artist["city"], state=new_artist["state"], phone=new_artist["phone"], genres=new_artist["genres"], facebook_link=new_artist["facebook_link"], location_id=locations.get_location_id(new_artist["city"], new_artist["state"]))
     db.session.add(artist)
     db.session.commit()
+    artist_id=artist.id
   except:
     error=True
     db.session.rollback()
@@ -405,6 +502,7 @@ def create_artist_submission():
     render_template('errors/500.html')
   else:
     """On successful db insert, flash success."""
+    artist_changed(artist_id)
     flash('Artist ' + request.form['name'] + ' was successfully listed!')
     return redirect(url_for('index'))
 
@@ -412,21 +510,32 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@cached_page(lambda: ['shows'])
 def shows():
-  """Displays list of shows at /shows"""
-  shows=Show.query.all()
-  """Loop through all shows and populate data."""
-  data=[]
-  for show in shows:
-    """Get venue and artist info."""
-    venue=Venue.query.get(show.venue_id)
-    artist=Artist.query.get(show.artist_id)
-    """Set venue and artist info."""
-    show.venue_name=venue.name
-    show.artist_name=artist.name
-    show.artist_image_link=artist.image_link
-    data.append(show)
-  return render_template('pages/shows.html', shows=data)
+  """Displays list of shows at /shows
+  
+  Shows are joined with their venue and artist in a single query that only
+  selects the columns the page renders, and paginated with a keyset on
+  (start_time, id) using the ?after= and ?before= cursors.
+  """
+  query=db.session.query(
+    Show.id,
+    Show.start_time,
+    Show.venue_id,
+    Venue.name.label('venue_name'),
+    Show.artist_id,
+    Artist.name.label('artist_name'),
+    Artist.image_link.label('artist_image_link')
+  ).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id)
+  page=keyset_page(
+    query,
+    columns=(Show.start_time, Show.id),
+    key=lambda show: (show.start_time, show.id),
+    per_page=app.config['SHOWS_PER_PAGE'],
+    after=cursor_arg('after', dateutil.parser.parse, int),
+    before=cursor_arg('before', dateutil.parser.parse, int)
+  )
+  return render_template('pages/shows.html', shows=page.items, page=page)
 
 @app.route('/shows/create')
 def create_shows():
@@ -438,13 +547,25 @@ def create_shows():
 def create_show_submission():
   """Insert form data as a new Show record in the db."""
   error=False
-  artist_id=request.form['artist_id']
-  venue_id=request.form['venue_id']
-  start_time=request.form['start_time']
+  conflict=None
   try:
-    new_show=Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time)
-    db.session.add(new_show)
-    db.session.commit()
+    artist_id=int(request.form['artist_id'])
+    venue_id=int(request.form['venue_id'])
+    start_time=conflicts.parse_time(request.form['start_time'])
+    new_show=Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time, end_time=conflicts.default_end_time(start_time))
+    """Refuse double bookings of the venue or the artist"""
+    conflict=conflicts.find_conflicts([new_show]).get(0)
+    if not conflict:
+      db.session.add(new_show)
+      counters.shows_added([new_show])
+      db.session.commit()
+  except IntegrityError as integrity_error:
+    db.session.rollback()
+    if not conflicts.is_double_booking(integrity_error):
+      error=True
+      print(sys.exc_info())
+    else:
+      conflict=[conflicts.DOUBLE_BOOKING]
   except:
     error=True
     db.session.rollback()
@@ -454,11 +575,112 @@ def create_show_submission():
   if error:
     """On unsuccessful db insert, flash an error instead."""
     flash('An error occurred. Show could not be listed.')
-    render_template('errors/500.html')
+    return render_template('errors/500.html')
+  elif conflict:
+    flash('Show could not be listed. ' + ' '.join(conflict))
+    return redirect(url_for('create_shows'))
   else:
     """On successful db insert, flash success."""
+    shows_changed([(venue_id, artist_id)])
     flash('Show was successfully listed!')
-    return render_template('pages/home.html')
+    return redirect(url_for('index'))
+
+@app.route('/shows/batch', methods=['GET'])
+def create_shows_batch_form():
+  """Render the tour upload form."""
+  return render_template('forms/batch_shows.html', errors=[])
+
+@app.route('/shows/batch', methods=['POST'])
+def create_shows_batch():
+  """Insert the shows of an uploaded CSV file or of a JSON list in one transaction
+  
+  Every row is validated first and nothing is inserted unless all of them are
+  valid; the errors of the invalid rows are returned with a 400.
+  """
+  as_json=request.is_json
+  error=False
+  errors=[]
+  try:
+    if as_json:
+      rows=request.get_json(silent=True)
+      if isinstance(rows, dict):
+        rows=rows.get('shows')
+      if not isinstance(rows, list):
+        raise booking.BatchError([{'row': 0, 'errors': ['Expected a list of shows, or an object with a "shows" list.']}])
+    else:
+      upload=request.files.get('file')
+      if upload is None or not upload.filename:
+        raise booking.BatchError([{'row': 0, 'errors': ['Choose a CSV file to upload.']}])
+      rows=booking.read_csv(upload.stream)
+    created=booking.create_shows(rows, app.config['BOOKING_BATCH_LIMIT'])
+    db.session.commit()
+  except booking.BatchError as batch_error:
+    errors=batch_error.errors
+    db.session.rollback()
+  except IntegrityError as integrity_error:
+    db.session.rollback()
+    if not conflicts.is_double_booking(integrity_error):
+      error=True
+      print(sys.exc_info())
+    else:
+      errors=[{'row': 0, 'errors': [conflicts.DOUBLE_BOOKING]}]
+  except:
+    error=True
+    db.session.rollback()
+    print(sys.exc_info())
+  finally:
+    db.session.close()
+  if error:
+    if as_json:
+      return jsonify({'success': False}), 500
+    flash('An error occurred. Shows could not be listed.')
+    return render_template('errors/500.html'), 500
+  if errors:
+    if as_json:
+      return jsonify({'success': False, 'errors': errors}), 400
+    return render_template('forms/batch_shows.html', errors=errors), 400
+  shows_changed(created)
+  if as_json:
+    return jsonify({'success': True, 'created': len(created)}), 201
+  flash('{} shows were successfully listed!'.format(len(created)))
+  return redirect(url_for('shows'))
+
+#  API
+#  ----------------------------------------------------------------
+
+@app.route('/api/search')
+def api_search():
+  """Return the top venues and artists whose name has a word starting with ?q= as JSON
+  
+  Served from the in-memory prefix index in typeahead.py, so as-you-type
+  requests do not hit the database.
+  """
+  q=request.args.get('q', '')
+  limit=request.args.get('limit', app.config['TYPEAHEAD_LIMIT'], type=int)
+  limit=max(1, min(limit, app.config['TYPEAHEAD_MAX_LIMIT']))
+  return jsonify(typeahead.get_typeahead().search(q, limit))
+
+#  Export
+#  ----------------------------------------------------------------
+
+@app.route('/export/<entity>.<fmt>')
+def export(entity, fmt):
+  """Stream a dump of venues, artists or shows as JSONL or CSV
+  
+  Requires an `Authorization: Bearer <EXPORT_TOKEN>` header; the route does
+  not exist while EXPORT_TOKEN is unset.
+  """
+  token=app.config.get('EXPORT_TOKEN')
+  if not token or entity not in exporter.ENTITIES or fmt not in exporter.FORMATS:
+    abort(404)
+  authorization=request.headers.get('Authorization', '')
+  if not hmac.compare_digest(authorization.encode('utf-8'), ('Bearer ' + token).encode('utf-8')):
+    return Response('Unauthorized\n', 401, {'WWW-Authenticate': 'Bearer'})
+  return Response(
+    stream_with_context(exporter.export(entity, fmt)),
+    mimetype=exporter.FORMATS[fmt],
+    headers={'Content-Disposition': 'attachment; filename={}.{}'.format(entity, fmt)}
+  )
 
 @app.errorhandler(404)
 def not_found_error(error):
@@ -469,16 +691,21 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
+file_handler = FileHandler('error.log', delay=True)
+file_handler.setFormatter(
+    Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+)
+file_handler.setLevel(logging.INFO)
+
 if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
     app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+# Slow queries are logged in debug mode too, see metrics.py
+metrics.slow_query_logger.setLevel(logging.INFO)
+metrics.slow_query_logger.addHandler(file_handler)
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
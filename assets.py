@@ -0,0 +1,203 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+from flask import request, send_from_directory, safe_join
+
+#----------------------------------------------------------------------------#
+# Static assets.
+#
+# `flask fyyur build-assets` copies every file of static/ to static/dist/
+# under a fingerprinted name (css/main.css -> css/main.1a2b3c4d5e6f.css) and
+# writes static/dist/manifest.json. Stylesheets are minified unless already
+# minified and their url()s rewritten to the fingerprinted names; text files
+# get precompressed .gz (and .br, with the brotli package) variants; the
+# splash image gets smaller copies for srcset (with Pillow).
+#
+# With STATIC_DIST on, url_for('static', filename=...) returns the
+# fingerprinted URL of files in the manifest, which are served with their
+# precompressed variant when the client accepts it and cached for a year,
+# since any change gives them a new name.
+#----------------------------------------------------------------------------#
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+ONE_YEAR = 365 * 24 * 3600
+
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.ttf', '.otf', '.eot', '.json', '.txt', '.html')
+# Images that get smaller copies for srcset, and the widths of the copies
+RESPONSIVE_IMAGES = ('img/front-splash.jpg',)
+RESPONSIVE_WIDTHS = (480, 800, 1200)
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def _fingerprint(path, content):
+  root, extension = posixpath.splitext(path)
+  return '{}.{}{}'.format(root, hashlib.sha256(content).hexdigest()[:12], extension)
+
+
+def minify_css(css):
+  """Drop comments and the whitespace around braces and semicolons
+
+  Deliberately conservative: the whitespace around ':' and ',' is kept, as
+  it is significant in selectors.
+  """
+  css = re.sub(r'/\*(?!!).*?\*/', '', css, flags=re.S)
+  css = re.sub(r'\s*([{};])\s*', r'\1', css)
+  css = re.sub(r'\s+', ' ', css)
+  return css.replace(';}', '}').strip()
+
+
+def _rewrite_urls(css, path, files):
+  """Point the relative url()s of the stylesheet at path to fingerprinted files"""
+  directory = posixpath.dirname(path)
+
+  def replace(match):
+    quote, url = match.groups()
+    if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+      return match.group(0)
+    target, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+    resolved = posixpath.normpath(posixpath.join(directory, target))
+    if resolved not in files:
+      return match.group(0)
+    return 'url({0}{1}{2}{0})'.format(quote, posixpath.relpath(files[resolved], directory), suffix)
+  return CSS_URL.sub(replace, css)
+
+
+def _write(output, path, content, progress):
+  target = os.path.join(output, *path.split('/'))
+  os.makedirs(os.path.dirname(target), exist_ok=True)
+  with open(target, 'wb') as target_file:
+    target_file.write(content)
+  if path.endswith(COMPRESSIBLE):
+    with open(target + '.gz', 'wb') as compressed:
+      compressed.write(gzip.compress(content, 9))
+    try:
+      import brotli
+    except ImportError:
+      pass
+    else:
+      with open(target + '.br', 'wb') as compressed:
+        compressed.write(brotli.compress(content))
+  if progress:
+    progress(path)
+
+
+def _responsive_copies(source, path, output, progress):
+  """Write the RESPONSIVE_WIDTHS copies of an image; returns [(path, width)]"""
+  try:
+    from PIL import Image
+  except ImportError:
+    if progress:
+      progress('Pillow is not installed, skipping the responsive copies of {}'.format(path))
+    return []
+  copies = []
+  with Image.open(source) as image:
+    for width in RESPONSIVE_WIDTHS:
+      if width >= image.width:
+        continue
+      resized = image.resize((width, int(image.height * width / image.width)), Image.LANCZOS)
+      root, extension = posixpath.splitext(path)
+      buffer_path = os.path.join(output, '.resize' + extension)
+      resized.save(buffer_path, quality=82, optimize=True, progressive=True)
+      with open(buffer_path, 'rb') as resized_file:
+        content = resized_file.read()
+      os.remove(buffer_path)
+      copy = _fingerprint('{}-{}w{}'.format(root, width, extension), content)
+      _write(output, copy, content, progress)
+      copies.append((copy, width))
+    copies.append((None, image.width))
+  return copies
+
+
+def build(static_folder, progress=None):
+  """Build static/dist and its manifest; returns the manifest"""
+  output = os.path.join(static_folder, DIST)
+  if os.path.isdir(output):
+    shutil.rmtree(output)
+  os.makedirs(output)
+
+  sources = []
+  for directory, folders, filenames in os.walk(static_folder):
+    folders[:] = [folder for folder in folders if os.path.join(directory, folder) != output]
+    for filename in filenames:
+      if filename.startswith('.'):
+        continue
+      source = os.path.join(directory, filename)
+      sources.append((os.path.relpath(source, static_folder).replace(os.sep, '/'), source))
+
+  files = {}
+  srcset = {}
+  """Stylesheets last, their url()s need the names of the files they refer to"""
+  for path, source in sorted(sources, key=lambda item: item[0].endswith('.css')):
+    with open(source, 'rb') as source_file:
+      content = source_file.read()
+    if path.endswith('.css'):
+      css = content.decode('utf-8')
+      if not path.endswith('.min.css'):
+        css = minify_css(css)
+      content = _rewrite_urls(css, path, files).encode('utf-8')
+    files[path] = _fingerprint(path, content)
+    _write(output, files[path], content, progress)
+    if path in RESPONSIVE_IMAGES:
+      copies = _responsive_copies(source, path, output, progress)
+      if copies:
+        srcset[path] = [(copy or files[path], width) for copy, width in copies]
+
+  manifest = {'files': files, 'srcset': srcset}
+  with open(os.path.join(output, MANIFEST), 'w') as manifest_file:
+    json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+  return manifest
+
+
+def load_manifest(static_folder):
+  try:
+    with open(os.path.join(static_folder, DIST, MANIFEST)) as manifest_file:
+      return json.load(manifest_file)
+  except (IOError, ValueError):
+    return None
+
+
+def init_app(app):
+  """Serve the fingerprinted assets of static/dist when STATIC_DIST is on and
+  a manifest was built"""
+  manifest = load_manifest(app.static_folder) if app.config.get('STATIC_DIST') else None
+  files = manifest['files'] if manifest else {}
+  srcsets = manifest['srcset'] if manifest else {}
+
+  @app.url_defaults
+  def fingerprinted_static(endpoint, values):
+    if endpoint == 'static' and values.get('filename') in files:
+      values['filename'] = DIST + '/' + files[values['filename']]
+
+  def static_srcset(filename):
+    """Return the srcset attribute value of an image, empty without copies"""
+    return ', '.join(
+      '{} {}w'.format(app.static_url_path + '/' + DIST + '/' + path, width) for path, width in srcsets.get(filename, [])
+    )
+  app.jinja_env.globals['static_srcset'] = static_srcset
+
+  send_static_file = app.view_functions['static']
+
+  def static(filename):
+    if not filename.startswith(DIST + '/'):
+      return send_static_file(filename)
+    path = safe_join(app.static_folder, filename)
+    mimetype = mimetypes.guess_type(filename)[0]
+    response = None
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+      if request.accept_encodings[encoding] and path and os.path.isfile(path + suffix):
+        response = send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype)
+        response.headers['Content-Encoding'] = encoding
+        break
+    if response is None:
+      response = send_from_directory(app.static_folder, filename, mimetype=mimetype)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'public, max-age={}, immutable'.format(ONE_YEAR)
+    return response
+  app.view_functions['static'] = static
@@ -0,0 +1,254 @@
+import json
+import random
+import time
+import tracemalloc
+import babel.dates
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import event
+from forms import VenueForm
+from models import db, Venue, Artist, Show
+from metrics import percentiles
+from formatting import FORMATS, format_datetime, clear_cache
+from importer import batched, insert_rows, location_ids
+from locations import location_key
+import counters
+
+#----------------------------------------------------------------------------#
+# Benchmarks.
+#
+# seed_catalogue() fills the database (Postgres or SQLite, see DATABASE_URL)
+# with a synthetic catalogue, and run_benchmark() drives every read route
+# through the Flask test client, reporting latency percentiles, queries per
+# request and peak memory per route. compare() checks a run against a saved
+# baseline. Both are exposed as `flask fyyur seed` and `flask fyyur bench`.
+#----------------------------------------------------------------------------#
+
+GENRES = [choice for choice, _ in VenueForm.genres.kwargs['choices']]
+AREAS = [
+  ('New York', 'NY'), ('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('Chicago', 'IL'),
+  ('Austin', 'TX'), ('Houston', 'TX'), ('Seattle', 'WA'), ('Portland', 'OR'),
+  ('Denver', 'CO'), ('Nashville', 'TN'), ('New Orleans', 'LA'), ('Atlanta', 'GA'),
+  ('Boston', 'MA'), ('Philadelphia', 'PA'), ('Miami', 'FL'), ('Detroit', 'MI')
+]
+WORDS = [
+  'Blue', 'Velvet', 'Electric', 'Golden', 'Midnight', 'Wild', 'Silver', 'Neon',
+  'Crimson', 'Lucky', 'Rusty', 'Broken', 'Hidden', 'Royal', 'Copper', 'Little',
+  'Owl', 'Tiger', 'Lantern', 'Harbor', 'Garden', 'Station', 'Cellar', 'Echo',
+  'Room', 'Hall', 'Club', 'Lounge', 'Band', 'Collective', 'Trio', 'Sound'
+]
+
+def _name(rng, suffix):
+  return ' '.join(rng.sample(WORDS, 2)) + ' ' + suffix
+
+
+def _next_id(model):
+  return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+def seed_catalogue(venues=10000, artists=50000, shows=1000000, seed=0, progress=None):
+  """Insert a synthetic catalogue in batches and return the new id ranges
+
+  Rows are generated and inserted importer.BATCH_SIZE at a time, so memory does not
+  grow with the size of the catalogue. Counters are rebuilt at the end.
+  """
+  rng = random.Random(seed)
+  db.create_all()
+  now = datetime.now(timezone.utc).replace(microsecond=0)
+  first_venue, first_artist = _next_id(Venue), _next_id(Artist)
+  places = location_ids(AREAS)
+
+  def venue_rows():
+    for i in range(venues):
+      city, state = rng.choice(AREAS)
+      yield {
+        'id': first_venue + i, 'name': _name(rng, 'Venue'), 'city': city, 'state': state,
+        'location_id': places[location_key(city, state)],
+        'address': '%d Main St' % rng.randint(1, 9999), 'phone': '555-%04d' % rng.randint(0, 9999),
+        'genres': rng.sample(GENRES, rng.randint(1, 3)), 'seeking_talent': rng.random() < 0.3,
+        'image_link': 'https://example.com/venues/%d.jpg' % (first_venue + i),
+        'timestamp': now - timedelta(minutes=venues - i)
+      }
+
+  def artist_rows():
+    for i in range(artists):
+      city, state = rng.choice(AREAS)
+      yield {
+        'id': first_artist + i, 'name': _name(rng, 'Band'), 'city': city, 'state': state,
+        'location_id': places[location_key(city, state)],
+        'phone': '555-%04d' % rng.randint(0, 9999), 'genres': rng.sample(GENRES, rng.randint(1, 2)),
+        'seeking_venue': rng.random() < 0.3,
+        'image_link': 'https://example.com/artists/%d.jpg' % (first_artist + i),
+        'timestamp': now - timedelta(minutes=artists - i)
+      }
+
+  def show_rows():
+    """Random shows overlap, so they get no end_time, which leaves them out of
+    the booking conflict checks"""
+    for _ in range(shows):
+      yield {
+        'venue_id': first_venue + rng.randrange(venues),
+        'artist_id': first_artist + rng.randrange(artists),
+        'start_time': now + timedelta(hours=rng.randint(-2 * 365 * 24, 365 * 24))
+      }
+
+  for model, rows, total in ((Venue, venue_rows(), venues), (Artist, artist_rows(), artists), (Show, show_rows(), shows)):
+    if not total or (model is Show and not (venues and artists)):
+      continue
+    done = 0
+    started = time.perf_counter()
+    for batch in batched(rows):
+      insert_rows(model.__table__, batch)
+      db.session.commit()
+      done += len(batch)
+      if progress:
+        progress('{}: {}/{} rows ({:.0f} rows/s)'.format(
+          model.__tablename__, done, total, done / max(time.perf_counter() - started, 1e-9)
+        ))
+
+  if db.engine.dialect.name == 'postgresql':
+    """Explicit ids were inserted, move the sequences past them"""
+    for model in (Venue, Artist):
+      db.session.execute(
+        "SELECT setval(pg_get_serial_sequence('\"{0}\"', 'id'), (SELECT max(id) FROM \"{0}\"))".format(model.__tablename__)
+      )
+  counters.rebuild_counters()
+  db.session.commit()
+  return {
+    'venues': (first_venue, first_venue + venues - 1),
+    'artists': (first_artist, first_artist + artists - 1)
+  }
+
+
+def _routes(rng, venue_ids, artist_ids):
+  """Yield (name, method, url, data) of the requests of one benchmark round"""
+  yield 'index', 'GET', '/', None
+  yield 'venues', 'GET', '/venues', None
+  yield 'artists', 'GET', '/artists', None
+  yield 'shows', 'GET', '/shows', None
+  if venue_ids:
+    yield 'show_venue', 'GET', '/venues/%d' % rng.choice(venue_ids), None
+  if artist_ids:
+    yield 'show_artist', 'GET', '/artists/%d' % rng.choice(artist_ids), None
+  yield 'search_venues', 'POST', '/venues/search', {'search_term': rng.choice(WORDS)}
+  yield 'search_artists', 'POST', '/artists/search', {'search_term': rng.choice(WORDS)}
+  yield 'search_location', 'POST', '/venues/search', {'search_term': '%s, %s' % rng.choice(AREAS)}
+
+
+def run_benchmark(app, iterations=50, warmup=5, seed=0):
+  """Drive every read route and return {route: stats}
+
+  Latencies come from a first pass; peak memory is measured in a second,
+  shorter pass under tracemalloc, which would otherwise skew the timings.
+  """
+  rng = random.Random(seed)
+  client = app.test_client()
+  with app.app_context():
+    venue_ids = [venue_id for venue_id, in db.session.query(Venue.id).order_by(db.func.random()).limit(1000)]
+    artist_ids = [artist_id for artist_id, in db.session.query(Artist.id).order_by(db.func.random()).limit(1000)]
+    engine = db.engine
+
+  queries = [0]
+
+  def count_query(*args):
+    queries[0] += 1
+
+  samples = {}
+  event.listen(engine, 'after_cursor_execute', count_query)
+  try:
+    for round_number in range(warmup + iterations):
+      for name, method, url, data in _routes(rng, venue_ids, artist_ids):
+        queries[0] = 0
+        started = time.perf_counter()
+        response = client.open(url, method=method, data=data)
+        elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+          raise RuntimeError('{} {} returned {}'.format(method, url, response.status_code))
+        if round_number >= warmup:
+          route = samples.setdefault(name, {'latencies': [], 'queries': []})
+          route['latencies'].append(elapsed * 1000)
+          route['queries'].append(queries[0])
+  finally:
+    event.remove(engine, 'after_cursor_execute', count_query)
+
+  peaks = {}
+  for _ in range(max(1, iterations // 10)):
+    for name, method, url, data in _routes(rng, venue_ids, artist_ids):
+      tracemalloc.start()
+      client.open(url, method=method, data=data)
+      peak = tracemalloc.get_traced_memory()[1]
+      tracemalloc.stop()
+      peaks[name] = max(peaks.get(name, 0), peak)
+
+  results = {}
+  for name, route in samples.items():
+    results[name] = dict(percentiles(route['latencies']))
+    results[name]['queries_per_request'] = sum(route['queries']) / float(len(route['queries']))
+    results[name]['peak_memory_kb'] = peaks.get(name, 0) / 1024.0
+  return results
+
+
+def bench_format_datetime(shows=500, renders=20, seed=0):
+  """Time the datetime filter over a listing of shows rendered renders times
+
+  Returns the milliseconds per render of the plain babel call the filter used
+  to make and of formatting.format_datetime, starting from a cold cache.
+  """
+  rng = random.Random(seed)
+  now = datetime.now(timezone.utc).replace(microsecond=0)
+  start_times = [now + timedelta(hours=rng.randint(-24 * 365, 24 * 365)) for _ in range(shows)]
+  pattern = FORMATS['full']
+
+  def timed(format_one):
+    started = time.perf_counter()
+    for _ in range(renders):
+      for start_time in start_times:
+        format_one(start_time)
+    return (time.perf_counter() - started) * 1000 / renders
+
+  clear_cache()
+  return {
+    'babel_ms_per_render': timed(lambda value: babel.dates.format_datetime(value, pattern)),
+    'cached_ms_per_render': timed(lambda value: format_datetime(value, 'full'))
+  }
+
+
+def compare(results, baseline, tolerance=0.2):
+  """Return the regressions of results against a baseline, as messages
+
+  A route regresses when its p95 latency or peak memory grows by more than
+  tolerance, or when it issues more queries per request.
+  """
+  regressions = []
+  for name, route in sorted(results.items()):
+    before = baseline.get(name)
+    if before is None:
+      continue
+    if route['p95'] > before['p95'] * (1 + tolerance):
+      regressions.append('{}: p95 {:.1f} ms, baseline {:.1f} ms'.format(name, route['p95'], before['p95']))
+    if route['queries_per_request'] > before['queries_per_request']:
+      regressions.append('{}: {:.1f} queries per request, baseline {:.1f}'.format(
+        name, route['queries_per_request'], before['queries_per_request']))
+    if route['peak_memory_kb'] > before['peak_memory_kb'] * (1 + tolerance):
+      regressions.append('{}: peak memory {:.0f} KB, baseline {:.0f} KB'.format(
+        name, route['peak_memory_kb'], before['peak_memory_kb']))
+  return regressions
+
+
+def format_results(results):
+  """Render results as a table"""
+  lines = ['{:<16} {:>9} {:>9} {:>9} {:>9} {:>11}'.format('route', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'peak KB')]
+  for name, route in sorted(results.items()):
+    lines.append('{:<16} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.1f} {:>11.0f}'.format(
+      name, route['p50'], route['p95'], route['p99'], route['queries_per_request'], route['peak_memory_kb']
+    ))
+  return '\n'.join(lines)
+
+
+def load_baseline(path):
+  with open(path) as baseline_file:
+    return json.load(baseline_file)
+
+
+def save_baseline(path, results):
+  with open(path, 'w') as baseline_file:
+    json.dump(results, baseline_file, indent=2, sort_keys=True)
@@ -0,0 +1,115 @@
+import csv
+import io
+from models import db, Venue, Artist, Show
+import counters
+import conflicts
+from importer import existing_ids
+
+#----------------------------------------------------------------------------#
+# Batch booking.
+#
+# Creates the shows of a whole tour at once, from an uploaded CSV file or a
+# JSON list of {venue_id, artist_id, start_time[, end_time]} objects. The
+# batch is validated as a whole, with one IN query for the venues, one for
+# the artists and one per kind for the booking conflicts, and then inserted
+# with a single multi-row INSERT in one transaction: either every show is
+# created or none is, and the caller gets the errors of every invalid row.
+#----------------------------------------------------------------------------#
+
+FIELDS = ('venue_id', 'artist_id', 'start_time', 'end_time')
+
+
+class BatchError(Exception):
+  """A batch was rejected; errors is a list of {'row': n, 'errors': [...]}"""
+
+  def __init__(self, errors):
+    super(BatchError, self).__init__('{} invalid row(s)'.format(len(errors)))
+    self.errors = errors
+
+
+def read_csv(stream):
+  """Return the rows of an uploaded CSV file with a venue_id, artist_id, start_time header"""
+  text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+  try:
+    return list(csv.DictReader(text))
+  except (UnicodeDecodeError, csv.Error) as error:
+    raise BatchError([{'row': 0, 'errors': ['The file is not a UTF-8 CSV file ({}).'.format(error)]}])
+
+
+def _parse(row):
+  """Return (values, errors) of one submitted row"""
+  values = {}
+  errors = []
+  if not isinstance(row, dict):
+    return values, ['Expected an object with {}.'.format(', '.join(FIELDS))]
+  for field in ('venue_id', 'artist_id'):
+    try:
+      values[field] = int(row.get(field))
+    except (TypeError, ValueError):
+      errors.append('{} must be an integer.'.format(field))
+  start_time = row.get('start_time')
+  try:
+    values['start_time'] = conflicts.parse_time(start_time)
+  except (TypeError, ValueError, OverflowError):
+    errors.append('start_time must be a date and time, e.g. 2020-05-21 21:30.')
+  end_time = row.get('end_time')
+  try:
+    values['end_time'] = conflicts.parse_time(end_time) if end_time else None
+  except (TypeError, ValueError, OverflowError):
+    errors.append('end_time must be a date and time, e.g. 2020-05-21 23:30.')
+  if 'start_time' in values and values.get('end_time') is None:
+    values['end_time'] = conflicts.default_end_time(values['start_time'])
+  if 'start_time' in values and values.get('end_time'):
+    duration_error = conflicts.check_duration(values['start_time'], values['end_time'])
+    if duration_error:
+      errors.append(duration_error)
+  return values, errors
+
+
+def validate(rows, limit):
+  """Return the Show instances of rows, or raise BatchError
+
+  Rows are numbered from 1 in the errors, in the order they were submitted.
+  """
+  if not rows:
+    raise BatchError([{'row': 0, 'errors': ['The batch is empty.']}])
+  if len(rows) > limit:
+    raise BatchError([{'row': 0, 'errors': ['At most {} shows can be created at once.'.format(limit)]}])
+  parsed = [_parse(row) for row in rows]
+  venues = existing_ids(Venue, {values['venue_id'] for values, _ in parsed if 'venue_id' in values})
+  artists = existing_ids(Artist, {values['artist_id'] for values, _ in parsed if 'artist_id' in values})
+  for values, row_errors in parsed:
+    if 'venue_id' in values and values['venue_id'] not in venues:
+      row_errors.append('Venue {} does not exist.'.format(values['venue_id']))
+    if 'artist_id' in values and values['artist_id'] not in artists:
+      row_errors.append('Artist {} does not exist.'.format(values['artist_id']))
+  """Conflicts are only looked for among the rows that are otherwise valid"""
+  valid = [(number, Show(**values)) for number, (values, row_errors) in enumerate(parsed, 1) if not row_errors]
+  overlapping = conflicts.find_conflicts(
+    [show for _, show in valid], ['row {}'.format(number) for number, _ in valid]
+  )
+  for position, messages in overlapping.items():
+    parsed[valid[position][0] - 1][1].extend(messages)
+  errors = [{'row': number, 'errors': row_errors} for number, (_, row_errors) in enumerate(parsed, 1) if row_errors]
+  if errors:
+    raise BatchError(errors)
+  return [show for _, show in valid]
+
+
+def create_shows(rows, limit):
+  """Validate rows and insert them as shows in one statement; the caller commits
+
+  Returns the created shows as (venue_id, artist_id) pairs.
+  """
+  shows = validate(rows, limit)
+  counters.shows_added(shows)
+  db.session.execute(Show.__table__.insert().values([
+    {
+      'venue_id': show.venue_id,
+      'artist_id': show.artist_id,
+      'start_time': show.start_time,
+      'end_time': show.end_time,
+      'counted_as_past': show.counted_as_past
+    } for show in shows
+  ]))
+  return [(show.venue_id, show.artist_id) for show in shows]
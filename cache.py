@@ -0,0 +1,160 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, session, make_response
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#
+# Rendered GET pages are cached under a key made of the request path, its
+# query string and the current version of every namespace the page depends on
+# (e.g. 'venues' for the listing or 'venue:3' for a detail page). Invalidating
+# a namespace bumps its version, so every page that depends on it misses from
+# then on and the stale entries simply age out. This works the same way for
+# the in-process backend and for a shared Redis.
+#----------------------------------------------------------------------------#
+
+def _initial_version():
+  """Versions start at the current time rather than 0, so a version that was
+  lost (e.g. a Redis restart) never comes back with a value already used"""
+  return int(time.time() * 1000)
+
+
+class NullCache(object):
+  """Backend that never stores anything, i.e. caching disabled"""
+
+  def get(self, key):
+    return None
+
+  def set(self, key, value, timeout):
+    pass
+
+  def version(self, namespace):
+    return 0
+
+  def bump(self, namespace):
+    pass
+
+
+class SimpleCache(NullCache):
+  """In-process LRU cache with per entry expiry"""
+
+  def __init__(self, max_entries=2048):
+    self._lock = threading.Lock()
+    self._entries = OrderedDict()
+    self._versions = {}
+    self._max_entries = max_entries
+
+  def get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      expires, value = entry
+      if expires is not None and expires < time.time():
+        del self._entries[key]
+        return None
+      self._entries.move_to_end(key)
+      return value
+
+  def set(self, key, value, timeout):
+    with self._lock:
+      expires = time.time() + timeout if timeout else None
+      self._entries[key] = (expires, value)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self._max_entries:
+        self._entries.popitem(last=False)
+
+  def version(self, namespace):
+    with self._lock:
+      return self._versions.setdefault(namespace, _initial_version())
+
+  def bump(self, namespace):
+    with self._lock:
+      self._versions[namespace] = self._versions.get(namespace, _initial_version()) + 1
+
+
+class RedisCache(NullCache):
+  """Cache shared by all workers, stored in Redis (or any compatible server)"""
+
+  def __init__(self, url, prefix='fyyur:'):
+    try:
+      import redis
+    except ImportError:
+      raise RuntimeError('CACHE_BACKEND = "redis" requires the redis package')
+    self._client = redis.Redis.from_url(url)
+    self._prefix = prefix
+
+  def get(self, key):
+    value = self._client.get(self._prefix + key)
+    return None if value is None else pickle.loads(value)
+
+  def set(self, key, value, timeout):
+    self._client.set(self._prefix + key, pickle.dumps(value), ex=timeout or None)
+
+  def version(self, namespace):
+    key = self._prefix + 'version:' + namespace
+    value = self._client.get(key)
+    if value is None:
+      self._client.set(key, _initial_version(), nx=True)
+      value = self._client.get(key)
+    return int(value)
+
+  def bump(self, namespace):
+    key = self._prefix + 'version:' + namespace
+    if not self._client.exists(key):
+      self._client.set(key, _initial_version(), nx=True)
+    self._client.incr(key)
+
+
+def get_cache():
+  """Return the cache backend of the current app, creating it on first use"""
+  cache = current_app.extensions.get('fyyur_cache')
+  if cache is None:
+    backend = current_app.config.get('CACHE_BACKEND', 'simple')
+    if backend == 'redis':
+      cache = RedisCache(current_app.config['CACHE_REDIS_URL'])
+    elif backend == 'simple':
+      cache = SimpleCache(current_app.config.get('CACHE_MAX_ENTRIES', 2048))
+    else:
+      cache = NullCache()
+    current_app.extensions['fyyur_cache'] = cache
+  return cache
+
+
+def invalidate(*namespaces):
+  """Make every cached page depending on one of namespaces stale"""
+  cache = get_cache()
+  for namespace in namespaces:
+    cache.bump(namespace)
+
+
+def cached_page(namespaces):
+  """Cache the rendered page of a GET view
+
+  namespaces is called with the view arguments and returns the namespaces the
+  page depends on. Pages are not cached or served from the cache while the
+  session holds flashed messages, since those are rendered into the layout.
+  """
+  def decorator(view):
+    @wraps(view)
+    def wrapper(**kwargs):
+      if request.method != 'GET' or session.get('_flashes'):
+        return view(**kwargs)
+      cache = get_cache()
+      versions = ','.join(
+        '{}@{}'.format(namespace, cache.version(namespace)) for namespace in namespaces(**kwargs)
+      )
+      key = 'page:{}?{}#{}'.format(request.path, request.query_string.decode('utf-8'), versions)
+      cached = cache.get(key)
+      if cached is not None:
+        mimetype, body = cached
+        return current_app.response_class(body, mimetype=mimetype)
+      response = make_response(view(**kwargs))
+      if response.status_code == 200:
+        cache.set(key, (response.mimetype, response.get_data()), current_app.config.get('CACHE_DEFAULT_TIMEOUT', 300))
+      return response
+    return wrapper
+  return decorator
@@ -0,0 +1,181 @@
+import os
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy.exc import SQLAlchemyError
+from models import db
+import benchmark
+import counters
+import importer
+import exporter
+import templating
+import assets
+import geo
+from cache import invalidate
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+fyyur_cli = AppGroup('fyyur', help='Fyyur maintenance commands.')
+
+
+@fyyur_cli.command('roll-shows')
+def roll_shows_command():
+  """Move shows that have started from the upcoming to the past counters.
+
+  Meant to run periodically, e.g. every few minutes from cron.
+  """
+  rolled = counters.roll_past_shows()
+  db.session.commit()
+  if rolled:
+    invalidate('venues', 'artists')
+  click.echo('Rolled {} show(s) into the past.'.format(rolled))
+
+
+@fyyur_cli.command('rebuild-counters')
+def rebuild_counters_command():
+  """Recompute the venue and artist show counters from scratch."""
+  counters.rebuild_counters()
+  db.session.commit()
+  invalidate('venues', 'artists')
+  click.echo('Show counters rebuilt.')
+
+
+@fyyur_cli.command('geocode')
+@click.option('--all', 'all_venues', is_flag=True, help='Locate every venue again, not only those without coordinates.')
+def geocode_command(all_venues):
+  """Set venue coordinates from the bundled gazetteer.
+
+  Restart the app afterwards when it uses the in-memory nearby search.
+  """
+  located, missing = geo.geocode_venues(all_venues)
+  db.session.commit()
+  invalidate('venues')
+  click.echo('Located {} venue(s); {} not found in the gazetteer.'.format(located, missing))
+
+
+@fyyur_cli.command('compile-templates')
+def compile_templates_command():
+  """Compile the page templates into the bytecode cache, e.g. when deploying."""
+  names = templating.warm_up(current_app)
+  cache = current_app.jinja_env.bytecode_cache
+  click.echo('Compiled {} template(s) into {}.'.format(len(names), cache.directory if cache else 'memory'))
+
+
+@fyyur_cli.command('build-assets')
+@click.option('--verbose', '-v', is_flag=True, help='List every file written.')
+def build_assets_command(verbose):
+  """Fingerprint and precompress static/ into static/dist.
+
+  Restart the app afterwards so it picks up the new manifest.
+  """
+  manifest = assets.build(current_app.static_folder, progress=click.echo if verbose else None)
+  click.echo('Built {} asset(s) into {}.'.format(
+    len(manifest['files']), os.path.join(current_app.static_folder, assets.DIST)
+  ))
+
+
+@fyyur_cli.command('seed')
+@click.option('--venues', default=10000, show_default=True, help='Number of venues to create.')
+@click.option('--artists', default=50000, show_default=True, help='Number of artists to create.')
+@click.option('--shows', default=1000000, show_default=True, help='Number of shows to create.')
+@click.option('--random-seed', default=0, show_default=True, help='Seed of the data generator.')
+def seed_command(venues, artists, shows, random_seed):
+  """Fill the database with a synthetic catalogue."""
+  benchmark.seed_catalogue(venues, artists, shows, seed=random_seed, progress=click.echo)
+  invalidate('home', 'venues', 'artists', 'shows')
+  click.echo('Seeded {} venues, {} artists and {} shows.'.format(venues, artists, shows))
+
+
+@fyyur_cli.command('import')
+@click.option('--venues', type=click.Path(exists=True, dir_okay=False), help='Venues file (.csv or .jsonl).')
+@click.option('--artists', type=click.Path(exists=True, dir_okay=False), help='Artists file (.csv or .jsonl).')
+@click.option('--shows', type=click.Path(exists=True, dir_okay=False), help='Shows file (.csv or .jsonl).')
+@click.option('--batch-size', default=importer.BATCH_SIZE, show_default=True, help='Rows written per batch.')
+def import_command(venues, artists, shows, batch_size):
+  """Bulk import venues, artists and shows from CSV or JSONL files.
+
+  Records get new ids. The venue_id and artist_id of the shows refer to the
+  id column of the venues and artists files imported in the same run, or to
+  existing database ids when those files are not given. Shows referring to
+  unknown venues or artists, or overlapping another show of their venue or
+  artist, are skipped.
+  """
+  if not (venues or artists or shows):
+    raise click.UsageError('Give at least one of --venues, --artists and --shows.')
+  loader = importer.Importer(batch_size=batch_size, progress=click.echo)
+  try:
+    counts = [
+      (label, load(path)) for label, load, path in (
+        ('venues', loader.import_venues, venues),
+        ('artists', loader.import_artists, artists),
+        ('shows', loader.import_shows, shows)
+      ) if path
+    ]
+  except (ValueError, SQLAlchemyError) as error:
+    db.session.rollback()
+    raise click.ClickException('{} (the batches before the failing one were imported)'.format(
+      getattr(error, 'orig', None) or error
+    ))
+  finally:
+    """Batches are committed as they go, so pages change even when one fails"""
+    invalidate('home', 'venues', 'artists', 'shows', *loader.touched)
+  click.echo('Imported {}; skipped {} invalid record(s) and {} double booking(s).'.format(
+    ', '.join('{} {}'.format(count, label) for label, count in counts), loader.skipped, loader.conflicts
+  ))
+
+
+@fyyur_cli.command('export')
+@click.argument('entity', type=click.Choice(sorted(exporter.ENTITIES)))
+@click.option('--format', 'fmt', type=click.Choice(sorted(exporter.FORMATS)), default='jsonl', show_default=True)
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8', lazy=True), default='-',
+              help='File to write to, standard output by default.')
+def export_command(entity, fmt, output):
+  """Dump venues, artists or shows as JSONL or CSV, e.g. for nightly exports.
+
+  The output can be loaded back with `flask fyyur import`.
+  """
+  for chunk in exporter.export(entity, fmt):
+    output.write(chunk)
+
+
+@fyyur_cli.command('bench')
+@click.option('--iterations', default=50, show_default=True, help='Measured rounds over all routes.')
+@click.option('--warmup', default=5, show_default=True, help='Unmeasured rounds run first.')
+@click.option('--with-cache', is_flag=True, help='Keep the page cache on instead of measuring every render.')
+@click.option('--baseline', type=click.Path(), help='Fail when results regress against this baseline file.')
+@click.option('--save-baseline', type=click.Path(), help='Write the results to this baseline file.')
+@click.option('--tolerance', default=0.2, show_default=True, help='Allowed relative growth of p95 latency and memory.')
+def bench_command(iterations, warmup, with_cache, baseline, save_baseline, tolerance):
+  """Benchmark every read route against the current database.
+
+  Seed a catalogue first with `flask fyyur seed`.
+  """
+  app = current_app._get_current_object()
+  if not with_cache:
+    app.config['CACHE_BACKEND'] = 'null'
+    app.extensions.pop('fyyur_cache', None)
+  results = benchmark.run_benchmark(app, iterations=iterations, warmup=warmup)
+  click.echo(benchmark.format_results(results))
+  if save_baseline:
+    benchmark.save_baseline(save_baseline, results)
+    click.echo('Baseline written to {}.'.format(save_baseline))
+  if baseline:
+    regressions = benchmark.compare(results, benchmark.load_baseline(baseline), tolerance)
+    for regression in regressions:
+      click.echo('REGRESSION ' + regression, err=True)
+    if regressions:
+      raise SystemExit(1)
+
+
+@fyyur_cli.command('bench-format')
+@click.option('--shows', default=500, show_default=True, help='Shows per simulated listing.')
+@click.option('--renders', default=20, show_default=True, help='Number of simulated renders.')
+def bench_format_command(shows, renders):
+  """Compare the datetime template filter with a plain babel call."""
+  results = benchmark.bench_format_datetime(shows, renders)
+  click.echo('babel.dates.format_datetime: {:8.2f} ms per render'.format(results['babel_ms_per_render']))
+  click.echo('datetime filter:             {:8.2f} ms per render ({:.1f}x)'.format(
+    results['cached_ms_per_render'], results['babel_ms_per_render'] / max(results['cached_ms_per_render'], 1e-9)
+  ))
@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from flask import current_app, g, has_request_context, copy_current_request_context
+from models import db
+import metrics
+
+try:
+  from gevent import joinall
+  from gevent.monkey import is_module_patched
+  from gevent.pool import Pool
+except ImportError:
+  is_module_patched = None
+
+#----------------------------------------------------------------------------#
+# Concurrent reads.
+#
+# gather() runs independent queries of a request at the same time, e.g. a
+# venue and its past and upcoming shows, so the request waits for the
+# slowest of them instead of their sum. Each call runs in a copy of the
+# request context, with a database session (and connection) of
+# its own. Its queries are counted in RequestStats of its own, added to the
+# stats of the request once every call is done. The objects it returns are
+# detached from that session: load everything the caller needs (joinedload)
+# inside the call.
+#
+# Under the gevent workers of gunicorn.conf.py (threading monkey-patched)
+# each call runs in a greenlet of a gevent pool shared by the requests of
+# the worker. psycogreen makes psycopg2 yield while it waits for PostgreSQL,
+# so a slow query pins neither the request nor the worker. The pool is
+# sized to the connection pool (pool_size + max_overflow) rather than to
+# READ_POOL_SIZE: a greenlet costs next to nothing, and the connections are
+# what bounds how many calls can query at once. A fixed thread pool there
+# would make the hundreds of requests of a worker queue behind a handful of
+# threads. Sync workers run the calls on a pool of READ_POOL_SIZE threads.
+#
+# With READ_POOL_SIZE 0, and on SQLite (whose in-memory databases are per
+# connection and whose writes are serialized anyway), the calls run one
+# after the other in the request thread.
+#----------------------------------------------------------------------------#
+
+def _gevent_patched():
+  """Whether gevent monkey-patched threading, as the gevent workers do"""
+  return is_module_patched is not None and is_module_patched('threading')
+
+
+def _get_pool():
+  """Return the pool of the current app: a gevent pool under gevent, a
+  thread pool otherwise, or None when reads run inline"""
+  if 'fyyur_read_pool' not in current_app.extensions:
+    size = current_app.config.get('READ_POOL_SIZE', 0)
+    if size <= 0 or db.engine.dialect.name == 'sqlite':
+      pool = None
+    elif _gevent_patched():
+      options = current_app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+      pool = Pool(options.get('pool_size', 5) + options.get('max_overflow', 10))
+    else:
+      pool = ThreadPoolExecutor(size, thread_name_prefix='fyyur-read')
+    current_app.extensions['fyyur_read_pool'] = pool
+  return current_app.extensions['fyyur_read_pool']
+
+
+def _run(pool, calls):
+  """Run the callables on pool and wait for all of them; return a getter of
+  the result (or exception) of each"""
+  if isinstance(pool, ThreadPoolExecutor):
+    futures = [pool.submit(call) for call in calls]
+    wait(futures)
+    return [future.result for future in futures]
+  greenlets = [pool.spawn(_outcome, call) for call in calls]
+  joinall(greenlets)
+  return [greenlet.value for greenlet in greenlets]
+
+
+def _outcome(call):
+  """Return a getter of the result of call, raising its exception again;
+  caught here so that gevent does not log an abort(404) as a crash"""
+  try:
+    result = call()
+  except Exception as exception:
+    def get(exception=exception):
+      raise exception
+    return get
+  return lambda: result
+
+
+def _bind(app, call, stats):
+  """Return call bound to a copy of the request context (an app context
+  outside of requests), counting its queries in stats"""
+  def run():
+    if stats is not None:
+      g.fyyur_request_stats = stats
+    return call()
+  if has_request_context():
+    return copy_current_request_context(run)
+  def run_in_app_context():
+    with app.app_context():
+      return run()
+  return run_in_app_context
+
+
+def gather(*calls):
+  """Run the callables concurrently and return their results in order; the
+  first exception raised by one of them is raised again here"""
+  pool = _get_pool()
+  if pool is None or len(calls) < 2:
+    return [call() for call in calls]
+  app = current_app._get_current_object()
+  request_stats = metrics.current_request_stats()
+  stats = [metrics.RequestStats() if request_stats is not None else None for call in calls]
+  results = _run(pool, [_bind(app, call, call_stats) for call, call_stats in zip(calls, stats)])
+  if request_stats is not None:
+    for call_stats in stats:
+      request_stats.merge(call_stats)
+  return [result() for result in results]
@@ -0,0 +1,147 @@
+from bisect import bisect_left
+from datetime import timedelta, timezone
+import dateutil.parser
+from flask import current_app
+from models import db, Show
+
+#----------------------------------------------------------------------------#
+# Booking conflicts.
+#
+# A venue or an artist cannot have two shows at overlapping times, a show
+# lasting from start_time to end_time (end excluded). On PostgreSQL this is
+# enforced by the exclusion constraints on tstzrange(start_time, end_time)
+# of the Show table (see models.py); the checks below report conflicts
+# before inserting, also on SQLite, with a message saying which show is in
+# the way.
+#
+# The shows that could overlap a batch are loaded with one bounded query per
+# resource kind: shows last at most SHOW_MAX_DURATION_HOURS, so only shows
+# starting in that window before the batch can reach into it, and the
+# (venue_id, start_time) and (artist_id, start_time) indexes serve the
+# range. Each venue and artist then gets an IntervalIndex, where a new show
+# is checked in O(log n).
+#
+# Show times are UTC throughout: submitted times go through parse_time(),
+# which takes a time without an offset as UTC and returns an aware datetime,
+# so PostgreSQL does not read it in the session time zone. SQLite returns
+# the stored times naive, and to_utc() takes those as UTC as well.
+#----------------------------------------------------------------------------#
+
+# SQLSTATE of a row rejected by an exclusion constraint
+EXCLUSION_VIOLATION = '23P01'
+# Error shown when the exclusion constraints reject a show
+DOUBLE_BOOKING = 'The venue or the artist was booked at that time in the meantime.'
+
+
+def to_utc(value):
+  """Return a show time as an aware UTC datetime; naive values are taken as UTC"""
+  if value.tzinfo is None:
+    return value.replace(tzinfo=timezone.utc)
+  return value.astimezone(timezone.utc)
+
+
+def parse_time(text):
+  """Parse a submitted show time; raises ValueError or OverflowError"""
+  return to_utc(dateutil.parser.parse(text))
+
+
+def is_double_booking(error):
+  """Whether an IntegrityError comes from the exclusion constraints on the
+  Show table, i.e. a double booking made by a concurrent request between
+  the check and the insert"""
+  return getattr(error.orig, 'pgcode', None) == EXCLUSION_VIOLATION
+
+
+class IntervalIndex(object):
+  """Disjoint [start, end) intervals of one venue or artist, sorted by start
+
+  Since the intervals do not overlap, their ends are sorted as well, so the
+  only interval that can overlap [start, end) among those starting before
+  end is the last one.
+  """
+
+  def __init__(self):
+    self._starts = []
+    self._intervals = []
+
+  def find(self, start, end):
+    """Return the payload of an interval overlapping [start, end), or None"""
+    start, end = to_utc(start), to_utc(end)
+    position = bisect_left(self._starts, end)
+    if position:
+      other_start, other_end, payload = self._intervals[position - 1]
+      if other_end > start:
+        return payload
+    return None
+
+  def add(self, start, end, payload=None):
+    """Add an interval that does not overlap any other (check with find first)"""
+    start, end = to_utc(start), to_utc(end)
+    position = bisect_left(self._starts, start)
+    self._starts.insert(position, start)
+    self._intervals.insert(position, (start, end, payload))
+
+
+def default_end_time(start_time):
+  """Return the end of a show starting at start_time whose end was not given"""
+  return start_time + timedelta(hours=current_app.config['SHOW_DURATION_HOURS'])
+
+
+def check_duration(start_time, end_time):
+  """Return an error message when a show cannot last from start_time to end_time"""
+  if to_utc(end_time) <= to_utc(start_time):
+    return 'end_time must be after start_time.'
+  if to_utc(end_time) - to_utc(start_time) > timedelta(hours=current_app.config['SHOW_MAX_DURATION_HOURS']):
+    return 'A show cannot last more than {} hours.'.format(current_app.config['SHOW_MAX_DURATION_HOURS'])
+  return None
+
+
+def _load(shows):
+  """Return {('venue'|'artist', id): IntervalIndex} of the booked shows that may
+  overlap one of shows"""
+  first = min((show.start_time for show in shows), key=to_utc)
+  last = max((show.end_time for show in shows), key=to_utc)
+  window = (
+    Show.start_time >= first - timedelta(hours=current_app.config['SHOW_MAX_DURATION_HOURS']),
+    Show.start_time < last,
+    Show.end_time > first
+  )
+  indexes = {}
+  for kind, foreign_key in (('venue', Show.venue_id), ('artist', Show.artist_id)):
+    ids = {getattr(show, kind + '_id') for show in shows}
+    booked = db.session.query(Show.id, foreign_key, Show.start_time, Show.end_time).filter(
+      foreign_key.in_(ids), *window
+    )
+    for show_id, entity_id, start_time, end_time in booked:
+      index = indexes.setdefault((kind, entity_id), IntervalIndex())
+      if index.find(start_time, end_time) is None:
+        index.add(start_time, end_time, 'show {}'.format(show_id))
+  return indexes
+
+
+def find_conflicts(shows, labels=None):
+  """Return {position: [messages]} of the shows that overlap a booked show or
+  an earlier show of the same list
+
+  shows are Show instances with venue_id, artist_id, start_time and end_time;
+  labels name them in the messages (by default 'row <position + 1>').
+  """
+  if not shows:
+    return {}
+  indexes = _load(shows)
+  conflicts = {}
+  for position, show in enumerate(shows):
+    messages = []
+    for kind in ('venue', 'artist'):
+      entity_id = getattr(show, kind + '_id')
+      index = indexes.setdefault((kind, entity_id), IntervalIndex())
+      other = index.find(show.start_time, show.end_time)
+      if other is not None:
+        messages.append('{} {} is already booked at that time ({}).'.format(kind.capitalize(), entity_id, other))
+    if messages:
+      conflicts[position] = messages
+      continue
+    for kind in ('venue', 'artist'):
+      indexes[(kind, getattr(show, kind + '_id'))].add(show.start_time, show.end_time,
+        labels[position] if labels else 'row {}'.format(position + 1))
+  return conflicts
@@ -0,0 +1,130 @@
+from datetime import datetime, timezone
+from models import db, Venue, Artist, Show
+from conflicts import to_utc
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#
+# Venue and Artist carry past_shows_count and upcoming_shows_count so listing
+# pages can display them without touching the Show table. Every show is
+# counted exactly once, on the side given by Show.counted_as_past:
+#
+#   * shows_added / shows_removed adjust the counters in the same transaction
+#     as the insert or delete,
+#   * roll_past_shows moves shows that have started since the last run from
+#     upcoming to past (run it periodically, see `flask fyyur roll-shows`),
+#   * rebuild_counters recomputes everything from the Show table.
+#----------------------------------------------------------------------------#
+
+# Shows flagged per UPDATE by roll_past_shows, their ids being bound one
+# parameter each
+ROLL_BATCH_SIZE = 1000
+
+
+def is_past(start_time):
+  """Whether a show starting at start_time belongs to the past counters;
+  naive times are UTC, see conflicts.py"""
+  return start_time is not None and to_utc(start_time) < datetime.now(timezone.utc)
+
+
+def _apply(model, deltas):
+  """Apply {id: (past delta, upcoming delta)} to the counters of model
+
+  Entities with the same deltas (e.g. every venue of a tour getting one
+  more upcoming show) are updated by a single statement.
+  """
+  groups = {}
+  for entity_id, (past, upcoming) in deltas.items():
+    if past or upcoming:
+      groups.setdefault((past, upcoming), []).append(entity_id)
+  for (past, upcoming), entity_ids in groups.items():
+    model.query.filter(model.id.in_(entity_ids)).update({
+      model.past_shows_count: model.past_shows_count + past,
+      model.upcoming_shows_count: model.upcoming_shows_count + upcoming,
+      model.version: model.version + 1
+    }, synchronize_session=False)
+
+
+def _deltas(shows, sign):
+  """Aggregate (venue_id, artist_id, counted_as_past) rows into counter deltas"""
+  venues = {}
+  artists = {}
+  for venue_id, artist_id, counted_as_past in shows:
+    for deltas, entity_id in ((venues, venue_id), (artists, artist_id)):
+      past, upcoming = deltas.get(entity_id, (0, 0))
+      if counted_as_past:
+        past += sign
+      else:
+        upcoming += sign
+      deltas[entity_id] = (past, upcoming)
+  return venues, artists
+
+
+def shows_added(shows):
+  """Count newly inserted shows; call before committing the insert
+
+  Marks each Show instance as counted_as_past when it already started, so a
+  later delete or roll takes it off the right counter.
+  """
+  rows = []
+  for show in shows:
+    show.counted_as_past = is_past(show.start_time)
+    rows.append((show.venue_id, show.artist_id, show.counted_as_past))
+  venues, artists = _deltas(rows, 1)
+  _apply(Venue, venues)
+  _apply(Artist, artists)
+
+
+def shows_removed(shows):
+  """Uncount shows that are about to be deleted; call before committing"""
+  rows = [(show.venue_id, show.artist_id, show.counted_as_past) for show in shows]
+  venues, artists = _deltas(rows, -1)
+  _apply(Venue, venues)
+  _apply(Artist, artists)
+
+
+def roll_past_shows():
+  """Move shows that have started since the last roll from upcoming to past
+
+  Only shows not yet counted as past are looked at, through the partial index
+  on start_time, so each run costs in proportion to the shows that aged since
+  the previous one. Returns the number of shows rolled.
+  """
+  cutoff = datetime.now(timezone.utc)
+  due = Show.query.filter(
+    db.not_(Show.counted_as_past),
+    Show.start_time < cutoff
+  )
+  """Lock the due shows so concurrent rolls cannot count them twice"""
+  rows = due.with_entities(Show.id, Show.venue_id, Show.artist_id).with_for_update().all()
+  if not rows:
+    return 0
+  venues, artists = _deltas([(venue_id, artist_id, False) for _, venue_id, artist_id in rows], 1)
+  _apply(Venue, {entity_id: (upcoming, -upcoming) for entity_id, (_, upcoming) in venues.items()})
+  _apply(Artist, {entity_id: (upcoming, -upcoming) for entity_id, (_, upcoming) in artists.items()})
+  """Flag the locked shows only: a show committed since the SELECT was not
+  counted above, the next roll picks it up"""
+  ids = [show_id for show_id, _, _ in rows]
+  for start in range(0, len(ids), ROLL_BATCH_SIZE):
+    Show.query.filter(Show.id.in_(ids[start:start + ROLL_BATCH_SIZE])).update(
+      {Show.counted_as_past: True}, synchronize_session=False
+    )
+  return len(rows)
+
+
+def rebuild_counters():
+  """Recompute every counter and counted_as_past flag from the Show table"""
+  cutoff = datetime.now(timezone.utc)
+  Show.query.update({
+    Show.counted_as_past: db.case([(Show.start_time < cutoff, True)], else_=False)
+  }, synchronize_session=False)
+  for model, foreign_key in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+    def count(counted_as_past):
+      return db.select([db.func.count(Show.id)]).where(
+        db.and_(foreign_key == model.id, Show.counted_as_past == counted_as_past)
+      ).as_scalar()
+    model.query.update({
+      model.past_shows_count: count(True),
+      model.upcoming_shows_count: count(False),
+      model.version: model.version + 1
+    }, synchronize_session=False)
@@ -0,0 +1,86 @@
+import csv
+import io
+import json
+from models import db, Venue, Artist, Show
+from importer import VENUE_COLUMNS, ARTIST_COLUMNS
+
+#----------------------------------------------------------------------------#
+# Bulk export.
+#
+# Dumps venues, artists or shows as JSONL or CSV in the format read by
+# importer.py. Rows are fetched through a server-side cursor YIELD_PER at a
+# time and turned into text chunk by chunk, so exporting a table of any size
+# keeps only one chunk in memory. Used by `flask fyyur export` and the
+# /export/<entity>.<format> route.
+#----------------------------------------------------------------------------#
+
+YIELD_PER = 1000
+
+ENTITIES = {
+  'venues': (Venue, ('id',) + VENUE_COLUMNS),
+  'artists': (Artist, ('id',) + ARTIST_COLUMNS),
+  'shows': (Show, ('id', 'venue_id', 'artist_id', 'start_time', 'end_time'))
+}
+FORMATS = {
+  'jsonl': 'application/x-ndjson',
+  'csv': 'text/csv'
+}
+
+
+def _rows(entity):
+  """Yield the rows of entity as dicts, ordered by id"""
+  model, columns = ENTITIES[entity]
+  query = db.session.query(*[getattr(model, column) for column in columns]).order_by(model.id)
+  for row in query.execution_options(stream_results=True).yield_per(YIELD_PER):
+    yield dict(zip(columns, row))
+
+
+def _json_value(value):
+  if hasattr(value, 'isoformat'):
+    return value.isoformat()
+  return value
+
+
+def _csv_value(value):
+  """Genres as a ';' separated list, as importer.py reads them"""
+  if isinstance(value, list):
+    return ';'.join(value)
+  if isinstance(value, bool):
+    return 'true' if value else 'false'
+  return _json_value(value)
+
+
+def export_jsonl(entity):
+  """Yield the rows of entity as chunks of JSON lines"""
+  chunk = []
+  for row in _rows(entity):
+    chunk.append(json.dumps({column: _json_value(value) for column, value in row.items()}) + '\n')
+    if len(chunk) >= YIELD_PER:
+      yield ''.join(chunk)
+      chunk = []
+  if chunk:
+    yield ''.join(chunk)
+
+
+def export_csv(entity):
+  """Yield the rows of entity as chunks of CSV, header first"""
+  columns = ENTITIES[entity][1]
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  writer.writerow(columns)
+  rows = 0
+  for row in _rows(entity):
+    writer.writerow([_csv_value(row[column]) for column in columns])
+    rows += 1
+    if rows % YIELD_PER == 0:
+      yield buffer.getvalue()
+      buffer.seek(0)
+      buffer.truncate()
+  yield buffer.getvalue()
+
+
+def export(entity, fmt):
+  """Return a generator of text chunks of entity in format fmt"""
+  if fmt == 'csv':
+    return export_csv(entity)
+  return export_jsonl(entity)
@@ -1,13 +1,26 @@
+import os
 from fabric.api import local, settings, abort
 from fabric.contrib.console import confirm
 
+BASELINE = "benchmarks/baseline.json"
+
 # prepare for deployment
 
 
+def baseline():
+    # timings depend on the machine, so each one records its own baseline
+    if not os.path.isdir(os.path.dirname(BASELINE)):
+        os.makedirs(os.path.dirname(BASELINE))
+    local("flask fyyur bench --save-baseline {}".format(BASELINE))
+
+
 def test():
+    if not os.path.exists(BASELINE):
+        print("No benchmark baseline yet, recording {}.".format(BASELINE))
+        baseline()
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "flask fyyur bench --baseline {}".format(BASELINE), capture=True
         )
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
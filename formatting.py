@@ -0,0 +1,53 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+import babel.dates
+import dateutil.parser
+from babel import Locale
+
+#----------------------------------------------------------------------------#
+# Date formatting.
+#
+# The datetime filter runs once per show on the listing and detail pages.
+# babel.dates.format_datetime parses the locale and the pattern on every
+# call; here both are parsed once, and formatted strings are memoised, as the
+# same start times come back on every render of a page.
+#----------------------------------------------------------------------------#
+
+FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+
+# Number of (datetime, format) pairs whose formatted string is kept
+FORMAT_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=None)
+def _locale(name):
+  return Locale.parse(name)
+
+
+@lru_cache(maxsize=256)
+def _pattern(format):
+  return babel.dates.parse_pattern(FORMATS.get(format, format))
+
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def _format(value, utcoffset, format, locale):
+  """utcoffset is part of the cache key because aware datetimes of the same
+  instant in different time zones are equal but format differently"""
+  return _pattern(format).apply(value, _locale(locale))
+
+
+def format_datetime(value, format='medium', locale=None):
+  """Format a datetime (or a string parsed as one) with a babel pattern or
+  one of FORMATS; naive datetimes are taken as UTC, like babel does"""
+  if not isinstance(value, datetime):
+    value = dateutil.parser.parse(value)
+  if value.tzinfo is None:
+    value = value.replace(tzinfo=timezone.utc)
+  return _format(value, value.utcoffset(), format, locale or babel.dates.LC_TIME)
+
+
+def clear_cache():
+  _format.cache_clear()
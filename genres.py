@@ -0,0 +1,169 @@
+import threading
+from flask import current_app
+from sqlalchemy.dialects.postgresql import ARRAY, array
+from models import db
+from cache import get_cache
+from search import select_backend
+from reloading import Expiry
+
+#----------------------------------------------------------------------------#
+# Genre filtering.
+#
+# /venues and /artists can be narrowed to one or more ?genre= values, matched
+# with ?match=any (the default) or ?match=all. On PostgreSQL the filter is an
+# array overlap (&&) or containment (@>) on the genres column, served by its
+# GIN index; on SQLite, where genres are JSON, it looks into the array with
+# json_each(). The facet counts of other databases, e.g. SQLite in test
+# runs, come from an in-process inverted index {genre: set of ids} that is
+# built on first use, kept up to date through refresh() and rebuilt
+# SEARCH_INDEX_TTL seconds after loading it (see reloading.py). The backend
+# follows the SEARCH_BACKEND setting.
+#
+# facet_counts() returns the number of venues or artists per genre, computed
+# by one aggregate query and cached until the listing is invalidated.
+#----------------------------------------------------------------------------#
+
+MATCHES = ('any', 'all')
+
+
+def requested(args):
+  """Return (genres, match) of the query string; genres may repeat or be comma separated"""
+  genres = []
+  for value in args.getlist('genre'):
+    for genre in value.split(','):
+      genre = genre.strip()
+      if genre and genre not in genres:
+        genres.append(genre)
+  match = args.get('match', 'any')
+  if match not in MATCHES:
+    match = 'any'
+  return genres, match
+
+
+class GenreBackend(object):
+  """Base class of the genre backends"""
+
+  def criterion(self, model, genres, match):
+    """Return a filter on model matching any or all of genres"""
+    raise NotImplementedError
+
+  def counts(self, model):
+    """Return {genre: number of entities of model with that genre}"""
+    raise NotImplementedError
+
+  def refresh(self, model, entity_id):
+    """Pick up a created, edited or deleted entity"""
+    pass
+
+
+def array_criterion(model, genres, match):
+  """Filter on the PostgreSQL genres array
+
+  The column type is the generic ARRAY (it has a SQLite variant), which
+  lacks the PostgreSQL operators, hence op(). The literal is cast to the
+  column's varchar[], PostgreSQL has no varchar[] && text[] operator.
+  """
+  genres = db.cast(array(genres), ARRAY(db.String))
+  return model.genres.op('@>' if match == 'all' else '&&')(genres)
+
+
+def json_criterion(model, genres, match):
+  """Filter on the SQLite genres JSON array, with one correlated json_each()"""
+  genre = db.func.json_each(model.genres).alias('genre')
+  value = db.literal_column('genre.value')
+  if match == 'all':
+    matched = db.select([db.func.count(value.distinct())]).select_from(genre).where(value.in_(genres))
+    return matched.as_scalar() == len(genres)
+  return db.exists(db.select([db.literal(1)]).select_from(genre).where(value.in_(genres)))
+
+
+class PostgresGenreBackend(GenreBackend):
+  """Array operators served by the GIN indexes on genres"""
+
+  def criterion(self, model, genres, match):
+    return array_criterion(model, genres, match)
+
+  def counts(self, model):
+    genre = db.func.unnest(model.genres).label('genre')
+    genres = db.session.query(genre).subquery()
+    rows = db.session.query(genres.c.genre, db.func.count()).group_by(genres.c.genre)
+    return dict(rows)
+
+
+class MemoryGenreBackend(GenreBackend):
+  """In-process inverted index, the fallback for databases without arrays"""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._indexes = {}
+    self.expiry = Expiry(current_app.config['SEARCH_INDEX_TTL'])
+
+  def _index(self, model):
+    if self.expiry.expired():
+      self._indexes = {}
+      self.expiry.loaded()
+    index = self._indexes.get(model)
+    if index is None:
+      index = {'genres': {}, 'postings': {}}
+      for entity_id, genres in db.session.query(model.id, model.genres).yield_per(1000):
+        self._add(index, entity_id, genres)
+      self._indexes[model] = index
+    return index
+
+  def _add(self, index, entity_id, genres):
+    genres = set(genres or [])
+    index['genres'][entity_id] = genres
+    for genre in genres:
+      index['postings'].setdefault(genre, set()).add(entity_id)
+
+  def _remove(self, index, entity_id):
+    for genre in index['genres'].pop(entity_id, ()):
+      ids = index['postings'].get(genre)
+      if ids is not None:
+        ids.discard(entity_id)
+        if not ids:
+          del index['postings'][genre]
+
+  def criterion(self, model, genres, match):
+    """Filtered in SQL: the ids of the matching postings, bound one parameter
+    each, can exceed the variable limit of SQLite on a large catalogue"""
+    if db.engine.dialect.name == 'postgresql':
+      return array_criterion(model, genres, match)
+    return json_criterion(model, genres, match)
+
+  def counts(self, model):
+    with self._lock:
+      return dict((genre, len(ids)) for genre, ids in self._index(model)['postings'].items())
+
+  def refresh(self, model, entity_id):
+    with self._lock:
+      index = self._indexes.get(model)
+      if index is None:
+        return
+      self._remove(index, entity_id)
+      row = db.session.query(model.id, model.genres).filter(model.id == entity_id).first()
+      if row is not None:
+        self._add(index, row.id, row.genres)
+
+
+BACKENDS = {
+  'postgres': PostgresGenreBackend,
+  'memory': MemoryGenreBackend
+}
+
+
+def get_backend():
+  """Return the genre backend of the current app, creating it on first use"""
+  return select_backend('fyyur_genres', BACKENDS)
+
+
+def facet_counts(model, namespace):
+  """Return [(genre, count)] of model, most common first, cached until namespace
+  (the listing the counts are shown on) is invalidated"""
+  cache = get_cache()
+  key = 'facets:{}@{}'.format(model.__tablename__, cache.version(namespace))
+  counts = cache.get(key)
+  if counts is None:
+    counts = sorted(get_backend().counts(model).items(), key=lambda item: (-item[1], item[0]))
+    cache.set(key, counts, current_app.config.get('CACHE_DEFAULT_TIMEOUT', 300))
+  return counts
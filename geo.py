@@ -0,0 +1,224 @@
+import csv
+import math
+import threading
+from functools import lru_cache
+from flask import current_app
+from models import db, Venue
+from search import select_backend
+from reloading import Expiry
+from locations import location_key
+
+#----------------------------------------------------------------------------#
+# Venues near a point.
+#
+# Venues get a latitude and longitude from the gazetteer bundled with the app
+# (GAZETTEER_PATH, a city,state,latitude,longitude CSV), looked up by city
+# and state when a venue is created, edited or imported, or by
+# `flask fyyur geocode` for existing venues. Nothing is sent over the
+# network.
+#
+# near() returns the venues within a radius, or the nearest ones, sorted by
+# distance. On PostgreSQL it runs against a GiST index over
+# ll_to_earth(latitude, longitude) (cube and earthdistance extensions, see
+# the migration that creates it). Other databases, e.g. SQLite in test runs,
+# use an in-process grid of CELL_DEGREES cells that is built on first use,
+# kept up to date through refresh() and rebuilt SEARCH_INDEX_TTL seconds
+# after loading it (see reloading.py). The backend follows SEARCH_BACKEND.
+#----------------------------------------------------------------------------#
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# Half the circumference, no two points are further apart
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM
+
+# Side of the cells of the in-process grid
+CELL_DEGREES = 1.0
+# First radius tried by a nearest venues search without a radius; it grows
+# fourfold until enough venues are found
+START_RADIUS_KM = 50.0
+
+
+@lru_cache(maxsize=None)
+def load_gazetteer(path):
+  """Return {location key: (latitude, longitude)} of a gazetteer CSV, keyed
+  like the Location table (see locations.py)"""
+  places = {}
+  with open(path, newline='', encoding='utf-8') as gazetteer:
+    for record in csv.DictReader(gazetteer):
+      places[location_key(record['city'], record['state'])] = (float(record['latitude']), float(record['longitude']))
+  return places
+
+
+def geocode(city, state):
+  """Return (latitude, longitude) of a city, or None when the gazetteer does not have it"""
+  key = location_key(city, state)
+  if key is None:
+    return None
+  return load_gazetteer(current_app.config['GAZETTEER_PATH']).get(key)
+
+
+def geocode_venues(all_venues=False):
+  """Set the coordinates of the venues without any (of every venue with
+  all_venues), with one UPDATE per city; returns (located, not found)"""
+  query = db.session.query(Venue.city, Venue.state, db.func.count(Venue.id)).group_by(Venue.city, Venue.state)
+  if not all_venues:
+    query = query.filter(Venue.latitude.is_(None))
+  located = missing = 0
+  for city, state, count in query.all():
+    position = geocode(city, state)
+    if position is None:
+      missing += count
+      continue
+    venues = Venue.query.filter(Venue.city == city, Venue.state == state)
+    if not all_venues:
+      venues = venues.filter(Venue.latitude.is_(None))
+    venues.update({
+      'latitude': position[0],
+      'longitude': position[1],
+      'version': Venue.version + 1
+    }, synchronize_session=False)
+    located += count
+  return located, missing
+
+
+def haversine_km(latitude, longitude, other_latitude, other_longitude):
+  """Great circle distance between two points"""
+  phi, other_phi = math.radians(latitude), math.radians(other_latitude)
+  a = math.sin((other_phi - phi) / 2) ** 2 + math.cos(phi) * math.cos(other_phi) * math.sin(math.radians(other_longitude - longitude) / 2) ** 2
+  return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GeoBackend(object):
+  """Base class of the geo backends"""
+
+  def near(self, latitude, longitude, radius_km, limit):
+    """Return up to limit (id, distance in km) of the venues within radius_km
+    of the point, or of the nearest venues when radius_km is None, nearest first"""
+    raise NotImplementedError
+
+  def refresh(self, venue_id):
+    """Pick up a created, edited or deleted venue"""
+    pass
+
+
+class PostgresGeoBackend(GeoBackend):
+  """earthdistance search served by the GiST index on ll_to_earth(latitude, longitude)"""
+
+  def near(self, latitude, longitude, radius_km, limit):
+    origin = db.func.ll_to_earth(latitude, longitude)
+    point = db.func.ll_to_earth(Venue.latitude, Venue.longitude)
+    distance = db.func.earth_distance(origin, point)
+    query = db.session.query(Venue.id, distance / 1000.0).filter(Venue.latitude.isnot(None), Venue.longitude.isnot(None))
+    if radius_km is not None:
+      """earth_box is the indexed bounding cube, earth_distance trims its corners"""
+      query = query.filter(db.func.earth_box(origin, radius_km * 1000).op('@>')(point), distance <= radius_km * 1000)
+    """<-> is the index assisted k-nearest ordering of cube, the straight line
+    distance, which sorts the same as the great circle one"""
+    return [(venue_id, float(km)) for venue_id, km in query.order_by(point.op('<->')(origin)).limit(limit)]
+
+
+class MemoryGeoBackend(GeoBackend):
+  """In-process grid of venue positions, the fallback for databases without earthdistance"""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._positions = None
+    self._cells = {}
+    self.expiry = Expiry(current_app.config['SEARCH_INDEX_TTL'])
+
+  def _cell(self, latitude, longitude):
+    return (int(math.floor(latitude / CELL_DEGREES)), int(math.floor(longitude / CELL_DEGREES)))
+
+  def _add(self, venue_id, latitude, longitude):
+    self._positions[venue_id] = (latitude, longitude)
+    self._cells.setdefault(self._cell(latitude, longitude), set()).add(venue_id)
+
+  def _remove(self, venue_id):
+    position = self._positions.pop(venue_id, None)
+    if position is not None:
+      cell = self._cell(*position)
+      self._cells[cell].discard(venue_id)
+      if not self._cells[cell]:
+        del self._cells[cell]
+
+  def _load(self):
+    if self._positions is None or self.expiry.expired():
+      self._positions = {}
+      self._cells = {}
+      rows = db.session.query(Venue.id, Venue.latitude, Venue.longitude).filter(
+        Venue.latitude.isnot(None), Venue.longitude.isnot(None)
+      ).yield_per(1000)
+      for venue_id, latitude, longitude in rows:
+        self._add(venue_id, latitude, longitude)
+      self.expiry.loaded()
+
+  def _candidate_cells(self, latitude, longitude, radius_km):
+    """Cells overlapping the bounding box of the circle"""
+    delta_latitude = radius_km / KM_PER_DEGREE
+    rows = range(
+      int(math.floor(max(latitude - delta_latitude, -90) / CELL_DEGREES)),
+      int(math.floor(min(latitude + delta_latitude, 90) / CELL_DEGREES)) + 1
+    )
+    width = int(round(360 / CELL_DEGREES))
+    if abs(latitude) + delta_latitude >= 90:
+      columns = None
+    else:
+      delta_longitude = delta_latitude / math.cos(math.radians(abs(latitude) + delta_latitude))
+      columns = None if delta_longitude >= 180 else range(
+        int(math.floor((longitude - delta_longitude) / CELL_DEGREES)),
+        int(math.floor((longitude + delta_longitude) / CELL_DEGREES)) + 1
+      )
+    if columns is None or len(rows) * len(columns) > len(self._cells):
+      """A box larger than the occupied cells: filter those instead"""
+      wrapped = None if columns is None else set((column + width // 2) % width - width // 2 for column in columns)
+      return [ids for (row, column), ids in self._cells.items() if row in rows and (wrapped is None or column in wrapped)]
+    cells = []
+    for row in rows:
+      for column in columns:
+        ids = self._cells.get((row, (column + width // 2) % width - width // 2))
+        if ids:
+          cells.append(ids)
+    return cells
+
+  def _within(self, latitude, longitude, radius_km):
+    found = []
+    for ids in self._candidate_cells(latitude, longitude, radius_km):
+      for venue_id in ids:
+        distance = haversine_km(latitude, longitude, *self._positions[venue_id])
+        if distance <= radius_km:
+          found.append((distance, venue_id))
+    return found
+
+  def near(self, latitude, longitude, radius_km, limit):
+    with self._lock:
+      self._load()
+      if radius_km is not None:
+        found = self._within(latitude, longitude, radius_km)
+      else:
+        radius_km = START_RADIUS_KM
+        found = self._within(latitude, longitude, radius_km)
+        while len(found) < limit and radius_km < MAX_DISTANCE_KM:
+          radius_km *= 4
+          found = self._within(latitude, longitude, radius_km)
+    found.sort()
+    return [(venue_id, distance) for distance, venue_id in found[:limit]]
+
+  def refresh(self, venue_id):
+    with self._lock:
+      if self._positions is None:
+        return
+      self._remove(venue_id)
+      row = db.session.query(Venue.latitude, Venue.longitude).filter(Venue.id == venue_id).first()
+      if row is not None and row.latitude is not None and row.longitude is not None:
+        self._add(venue_id, row.latitude, row.longitude)
+
+
+BACKENDS = {
+  'postgres': PostgresGeoBackend,
+  'memory': MemoryGeoBackend
+}
+
+
+def get_backend():
+  """Return the geo backend of the current app, creating it on first use"""
+  return select_backend('fyyur_geo', BACKENDS)
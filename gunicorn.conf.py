@@ -0,0 +1,27 @@
+import multiprocessing
+import os
+
+#----------------------------------------------------------------------------#
+# Gunicorn settings, read by `gunicorn app:app` from the project directory.
+#
+# The default gevent workers serve many requests each: a request waiting on
+# PostgreSQL yields to the others instead of pinning the worker, and the
+# independent queries of a request (concurrency.py) run side by side.
+# psycogreen makes psycopg2 cooperate with gevent; without it every query
+# would still block the whole worker. FYYUR_WORKER_CLASS=sync goes back to
+# one request per worker process.
+#----------------------------------------------------------------------------#
+
+bind = '0.0.0.0:' + os.environ.get('PORT', '5000')
+worker_class = os.environ.get('FYYUR_WORKER_CLASS', 'gevent')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Requests served at once by a gevent worker; each one holds a database
+# connection while it queries, so keep FYYUR_DB_POOL_SIZE +
+# FYYUR_DB_MAX_OVERFLOW in line with it (waiting requests queue on the pool)
+worker_connections = int(os.environ.get('FYYUR_WORKER_CONNECTIONS', 100))
+
+
+def post_fork(server, worker):
+  if worker_class == 'gevent':
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
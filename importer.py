@@ -0,0 +1,299 @@
+import csv
+import io
+import json
+import time
+from models import db, Venue, Artist, Show, Location
+import counters
+import conflicts
+import geo
+import locations
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#
+# Streams CSV or JSONL files into the Venue, Artist and Show tables. Records
+# are read one at a time and written BATCH_SIZE at a time, with COPY on
+# PostgreSQL and executemany elsewhere, so memory does not grow with the file
+# size. The only state that grows is the map from the ids used in the files
+# to the ids allocated in the database, which lets the shows file refer to
+# venues and artists by their ids in the venues and artists files.
+#----------------------------------------------------------------------------#
+
+BATCH_SIZE = 5000
+
+VENUE_COLUMNS = (
+  'name', 'city', 'state', 'address', 'phone', 'genres', 'website', 'facebook_link',
+  'seeking_talent', 'seeking_description', 'image_link'
+)
+ARTIST_COLUMNS = (
+  'name', 'city', 'state', 'phone', 'genres', 'website', 'facebook_link',
+  'seeking_venue', 'seeking_description', 'image_link'
+)
+BOOLEAN_COLUMNS = ('seeking_talent', 'seeking_venue')
+
+
+def read_records(path):
+  """Yield the records of a .csv or .jsonl file as dicts, one at a time"""
+  if path.endswith('.csv'):
+    with open(path, newline='', encoding='utf-8') as records:
+      for record in csv.DictReader(records):
+        yield record
+  elif path.endswith('.jsonl') or path.endswith('.ndjson'):
+    with open(path, encoding='utf-8') as records:
+      for line in records:
+        if line.strip():
+          yield json.loads(line)
+  else:
+    raise ValueError('Unsupported file type: {} (expected .csv or .jsonl)'.format(path))
+
+
+def batched(rows, size=BATCH_SIZE):
+  """Yield lists of up to size rows"""
+  batch = []
+  for row in rows:
+    batch.append(row)
+    if len(batch) >= size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+
+def _genres(value):
+  """Genres come as a list (JSONL) or a JSON array or ';' separated string (CSV)"""
+  if value is None or isinstance(value, list):
+    return value
+  value = value.strip()
+  if value.startswith('['):
+    return json.loads(value)
+  return [genre.strip() for genre in value.split(';') if genre.strip()]
+
+
+def _boolean(value):
+  if isinstance(value, bool) or value is None:
+    return value
+  return value.strip().lower() in ('1', 'true', 't', 'yes', 'y')
+
+
+def _clean(record, columns):
+  row = {}
+  for column in columns:
+    value = record.get(column)
+    if value == '':
+      value = None
+    if column == 'genres':
+      value = _genres(value)
+    elif column in BOOLEAN_COLUMNS:
+      value = _boolean(value)
+    row[column] = value
+  return row
+
+
+def allocate_ids(model, count):
+  """Reserve count new primary keys of model
+
+  On PostgreSQL the keys come from the table's sequence, so concurrent
+  inserts through the app cannot collide with them. Other databases are
+  assumed to have a single writer during an import.
+  """
+  if db.engine.dialect.name == 'postgresql':
+    sequence = "pg_get_serial_sequence('\"{}\"', 'id')".format(model.__tablename__)
+    return [row[0] for row in db.session.execute(
+      'SELECT nextval({}) FROM generate_series(1, :count)'.format(sequence), {'count': count}
+    )]
+  first = (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+  return list(range(first, first + count))
+
+
+def _copy_value(value):
+  """Format a value for COPY ... WITH (FORMAT csv); None stays an unquoted NULL"""
+  if value is None:
+    return None
+  if isinstance(value, bool):
+    return 't' if value else 'f'
+  if isinstance(value, list):
+    return '{' + ','.join('"' + str(item).replace('\\', '\\\\').replace('"', '\\"') + '"' for item in value) + '}'
+  if hasattr(value, 'isoformat'):
+    return value.isoformat()
+  return value
+
+
+def insert_rows(table, rows):
+  """Insert a batch of row dicts into table, with COPY on PostgreSQL"""
+  if not rows:
+    return
+  if db.engine.dialect.name != 'postgresql':
+    db.session.execute(table.insert(), rows)
+    return
+  columns = list(rows[0].keys())
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  for row in rows:
+    writer.writerow([_copy_value(row[column]) for column in columns])
+  buffer.seek(0)
+  cursor = db.session.connection().connection.cursor()
+  cursor.copy_expert('COPY "{}" ({}) FROM STDIN WITH (FORMAT csv)'.format(
+    table.name, ', '.join('"{}"'.format(column) for column in columns)
+  ), buffer)
+
+
+def existing_ids(model, ids):
+  """Return which of ids exist, so unknown references can be reported or
+  skipped instead of failing the whole batch on the foreign key"""
+  if not ids:
+    return set()
+  return {row[0] for row in db.session.query(model.id).filter(model.id.in_(ids))}
+
+
+def location_ids(places):
+  """Return {key: id} of the locations of (city, state) pairs, creating the
+  missing ones with one insert; see locations.py"""
+  names = {}
+  for city, state in places:
+    key = locations.location_key(city, state)
+    if key is not None and key not in names:
+      names[key] = locations.display_name(city, state)
+  if not names:
+    return {}
+  ids = dict(db.session.query(Location.key, Location.id).filter(Location.key.in_(list(names))))
+  missing = [key for key in names if key not in ids]
+  if missing:
+    new_ids = allocate_ids(Location, len(missing))
+    insert_rows(Location.__table__, [
+      {'id': location_id, 'key': key, 'city': names[key][0], 'state': names[key][1]}
+      for location_id, key in zip(new_ids, missing)
+    ])
+    ids.update(zip(missing, new_ids))
+  return ids
+
+
+class Importer(object):
+  """Imports venues, artists and shows, remapping file ids to database ids"""
+
+  def __init__(self, batch_size=BATCH_SIZE, progress=None):
+    self.batch_size = batch_size
+    self.progress = progress
+    self.venue_ids = {}
+    self.artist_ids = {}
+    self.skipped = 0
+    self.conflicts = 0
+    self.shows_done = 0
+    self.touched = set()
+
+  def _report(self, label, done, started):
+    if self.progress:
+      elapsed = max(time.perf_counter() - started, 1e-9)
+      self.progress('{}: {} rows, {:.0f} rows/s'.format(label, done, done / elapsed))
+
+  def _import_entities(self, model, path, columns, id_map):
+    done = 0
+    started = time.perf_counter()
+    for batch in batched(read_records(path), self.batch_size):
+      records = [record for record in batch if record.get('name')]
+      self.skipped += len(batch) - len(records)
+      ids = allocate_ids(model, len(records))
+      rows = [_clean(record, columns) for record in records]
+      places = location_ids((row['city'], row['state']) for row in rows)
+      for new_id, record, row in zip(ids, records, rows):
+        row['id'] = new_id
+        row['location_id'] = places.get(locations.location_key(row['city'], row['state']))
+        if model is Venue:
+          row['latitude'], row['longitude'] = geo.geocode(row['city'], row['state']) or (None, None)
+        if record.get('id') not in (None, ''):
+          id_map[str(record['id'])] = new_id
+      insert_rows(model.__table__, rows)
+      db.session.commit()
+      done += len(rows)
+      self._report(model.__tablename__, done, started)
+    return done
+
+  def import_venues(self, path):
+    return self._import_entities(Venue, path, VENUE_COLUMNS, self.venue_ids)
+
+  def import_artists(self, path):
+    return self._import_entities(Artist, path, ARTIST_COLUMNS, self.artist_ids)
+
+  def _resolve(self, id_map, value):
+    """Map a file id to a database id
+
+    When no venues or artists file was imported in the same run the ids of
+    the shows file are taken as database ids.
+    """
+    if value in (None, ''):
+      return None
+    if id_map:
+      return id_map.get(str(value))
+    return int(value)
+
+  def import_shows(self, path):
+    """Import shows; counters are rebuilt once at the end instead of per row
+
+    Shows without an end_time get the default duration. Shows overlapping a
+    booked show or an earlier show of the file at the same venue or with the
+    same artist are skipped and reported, each batch being checked with
+    conflicts.find_conflicts() like a batch booking.
+    """
+    try:
+      return self._import_shows(path)
+    finally:
+      """Also after a failing batch: the batches before it are committed"""
+      if self.shows_done:
+        db.session.rollback()
+        counters.rebuild_counters()
+        db.session.commit()
+
+  def _import_shows(self, path):
+    done = 0
+    started = time.perf_counter()
+    for records in batched(enumerate(read_records(path), 1), self.batch_size):
+      rows = []
+      numbers = []
+      for number, record in records:
+        try:
+          venue_id = self._resolve(self.venue_ids, record.get('venue_id'))
+          artist_id = self._resolve(self.artist_ids, record.get('artist_id'))
+          start_time = record.get('start_time')
+          if isinstance(start_time, str):
+            start_time = conflicts.parse_time(start_time)
+          end_time = record.get('end_time')
+          if isinstance(end_time, str):
+            end_time = conflicts.parse_time(end_time) if end_time else None
+        except (ValueError, OverflowError):
+          venue_id = artist_id = start_time = None
+        if venue_id is None or artist_id is None or start_time is None:
+          self.skipped += 1
+          continue
+        if end_time is None:
+          end_time = conflicts.default_end_time(start_time)
+        if conflicts.check_duration(start_time, end_time):
+          self.skipped += 1
+          continue
+        rows.append({'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start_time, 'end_time': end_time})
+        numbers.append(number)
+      if not (self.venue_ids and self.artist_ids):
+        venues = existing_ids(Venue, {row['venue_id'] for row in rows})
+        artists = existing_ids(Artist, {row['artist_id'] for row in rows})
+        known = [position for position, row in enumerate(rows) if row['venue_id'] in venues and row['artist_id'] in artists]
+        self.skipped += len(rows) - len(known)
+        rows, numbers = [rows[position] for position in known], [numbers[position] for position in known]
+      overlapping = conflicts.find_conflicts(
+        [Show(**row) for row in rows], ['record {}'.format(number) for number in numbers]
+      )
+      for position, messages in sorted(overlapping.items()):
+        self.conflicts += 1
+        if self.progress:
+          self.progress('{}: skipped record {}: {}'.format(Show.__tablename__, numbers[position], ' '.join(messages)))
+      rows = [row for position, row in enumerate(rows) if position not in overlapping]
+      if not (self.venue_ids and self.artist_ids):
+        """Shows added to venues and artists that were already there change their pages"""
+        for row in rows:
+          if not self.venue_ids:
+            self.touched.add('venue:%d' % row['venue_id'])
+          if not self.artist_ids:
+            self.touched.add('artist:%d' % row['artist_id'])
+      insert_rows(Show.__table__, rows)
+      db.session.commit()
+      done += len(rows)
+      self.shows_done += len(rows)
+      self._report(Show.__tablename__, done, started)
+    return done
@@ -0,0 +1,81 @@
+import threading
+from flask import current_app
+from reloading import Expiry
+
+#----------------------------------------------------------------------------#
+# Latest feeds.
+#
+# The home page lists the most recently created venues and artists. Each feed
+# is a small ring of compact dicts, newest first, loaded with one query and
+# then kept current by refresh() on create, edit and delete, so rendering the
+# home page costs no queries. Every worker keeps its own rings, reloaded
+# LATEST_FEED_TTL seconds after loading them (see reloading.py).
+#----------------------------------------------------------------------------#
+
+class LatestFeed(object):
+  """Bounded, newest first list of the latest venues or artists"""
+
+  def __init__(self, model, size, ttl):
+    self.model = model
+    self.size = size
+    self.expiry = Expiry(ttl)
+    self._lock = threading.Lock()
+    self._items = None
+
+  def _columns(self):
+    model = self.model
+    return model.query.with_entities(model.id, model.name, model.image_link, model.timestamp)
+
+  def _item(self, row):
+    return {'id': row.id, 'name': row.name, 'image_link': row.image_link, 'timestamp': row.timestamp}
+
+  def _sort_key(self, item):
+    return (item['timestamp'], item['id'])
+
+  def items(self):
+    """Return the feed, loading it when it was never loaded or has expired"""
+    with self._lock:
+      if self._items is None or self.expiry.expired():
+        model = self.model
+        rows = self._columns().filter(model.timestamp.isnot(None)).order_by(
+          model.timestamp.desc(), model.id.desc()
+        ).limit(self.size)
+        self._items = [self._item(row) for row in rows]
+        self.expiry.loaded()
+      return list(self._items)
+
+  def refresh(self, entity_id):
+    """Pick up a created, edited or deleted entity
+
+    A created entity is inserted at its place and the oldest item falls off.
+    When an item of the feed is deleted the feed is reloaded on next use, as
+    the ring cannot know what came before its oldest item.
+    """
+    with self._lock:
+      if self._items is None:
+        return
+      row = self._columns().filter(self.model.id == entity_id).first()
+      items = [item for item in self._items if item['id'] != entity_id]
+      if row is None or row.timestamp is None:
+        if len(items) != len(self._items):
+          self._items = None
+        return
+      item = self._item(row)
+      if len(items) < self.size or self._sort_key(item) > self._sort_key(items[-1]):
+        items.append(item)
+        items.sort(key=self._sort_key, reverse=True)
+        del items[self.size:]
+      self._items = items
+
+
+def get_feed(model):
+  """Return the latest feed of model for the current app, creating it on first use"""
+  feeds = current_app.extensions.setdefault('fyyur_latest', {})
+  feed = feeds.get(model)
+  if feed is None:
+    feed = feeds[model] = LatestFeed(
+      model,
+      current_app.config['LATEST_FEED_SIZE'],
+      current_app.config['LATEST_FEED_TTL']
+    )
+  return feed
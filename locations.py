@@ -0,0 +1,53 @@
+from sqlalchemy.exc import IntegrityError
+from models import db, Location
+
+#----------------------------------------------------------------------------#
+# Locations.
+#
+# Every distinct city and state is a Location row, found by its key: city
+# and state case folded with their whitespace collapsed, so "new york, ny"
+# and "New  York, NY" are the same place. Venues and artists point to their
+# Location, which makes a "City, State" search one lookup on the unique key
+# index followed by one on the location_id index. Bulk loads resolve their
+# locations a batch at a time with importer.location_ids().
+#----------------------------------------------------------------------------#
+
+def display_name(city, state):
+  """Return the (city, state) stored on a new Location"""
+  return ' '.join(city.split()), ' '.join(state.split()).upper()
+
+
+def location_key(city, state):
+  """Return the key of a city and state, or None when either is missing"""
+  city = ' '.join((city or '').split()).casefold()
+  state = ' '.join((state or '').split()).casefold()
+  if not city or not state:
+    return None
+  return city + '|' + state
+
+
+def parse(term):
+  """Return the key of a "City, State" search term, or None"""
+  if ',' not in term:
+    return None
+  city, state = term.rsplit(',', 1)
+  return location_key(city, state)
+
+
+def get_location_id(city, state):
+  """Return the id of the Location of city and state, creating it if needed"""
+  key = location_key(city, state)
+  if key is None:
+    return None
+  location_id = db.session.query(Location.id).filter(Location.key == key).scalar()
+  if location_id is None:
+    try:
+      with db.session.begin_nested():
+        city, state = display_name(city, state)
+        location = Location(key=key, city=city, state=state)
+        db.session.add(location)
+      location_id = location.id
+    except IntegrityError:
+      """Created by a concurrent request in the meantime"""
+      location_id = db.session.query(Location.id).filter(Location.key == key).scalar()
+  return location_id
@@ -0,0 +1,227 @@
+import threading
+import numpy as np
+from flask import current_app
+from models import db, Venue, Artist, Show
+from reloading import Expiry
+
+#----------------------------------------------------------------------------#
+# Matchmaking.
+#
+# Recommends artists for a venue and venues for an artist. Candidates are
+# scored on
+#
+#   * genres: Jaccard similarity of the genre sets,
+#   * location: same city, or failing that same state,
+#   * history: how often the pair was booked together before,
+#   * seeking: whether the candidate is looking for a venue / for talent,
+#
+# weighted by WEIGHTS. Every venue and artist is a row of NumPy arrays (a 0/1
+# genre matrix with one column per genre, location codes, seeking flags), so
+# scoring all candidates is a handful of vectorised operations and the best
+# ones are picked with argpartition. The arrays are built from the database
+# on first use and updated row by row on create, edit and delete. Every
+# worker keeps its own arrays, rebuilt MATCH_TTL seconds after loading them
+# (see reloading.py).
+#----------------------------------------------------------------------------#
+
+# Weights of the score components, each of which is between 0 and 1
+WEIGHTS = {
+  'genres': 0.5,
+  'location': 0.25,
+  'history': 0.15,
+  'seeking': 0.1
+}
+# Share of the location score given for the same state in another city
+SAME_STATE = 0.5
+
+
+def _place(text):
+  return ' '.join((text or '').split()).casefold()
+
+
+class Side(object):
+  """Feature arrays of the venues or of the artists, one row per entity
+
+  The arrays are allocated with room to grow, and the row of a deleted
+  entity is only marked inactive, so a refresh never rebuilds them.
+  """
+
+  vectors = (('ids', np.int64), ('active', bool), ('seeking', bool), ('city', np.int32), ('state', np.int32), ('genre_counts', np.float32))
+
+  def __init__(self):
+    self.rows = {}
+    self.size = 0
+    self.genres = np.zeros((0, 0), dtype=np.float32)
+    for name, dtype in self.vectors:
+      setattr(self, name, np.zeros(0, dtype=dtype))
+
+  def _grow(self, rows, columns):
+    capacity, width = self.genres.shape
+    if rows > capacity:
+      capacity = max(rows, capacity * 2, 64)
+    if columns > width:
+      width = max(columns, width * 2, 32)
+    if (capacity, width) == self.genres.shape:
+      return
+    genres = np.zeros((capacity, width), dtype=np.float32)
+    genres[:self.genres.shape[0], :self.genres.shape[1]] = self.genres
+    self.genres = genres
+    for name, dtype in self.vectors:
+      vector = np.zeros(capacity, dtype=dtype)
+      vector[:len(getattr(self, name))] = getattr(self, name)
+      setattr(self, name, vector)
+
+  def set(self, entity_id, genres, city, state, seeking):
+    """Add or update an entity; genres are column numbers"""
+    row = self.rows.get(entity_id)
+    if row is None:
+      row = self.rows[entity_id] = self.size
+      self.size += 1
+    self._grow(self.size, max(genres, default=-1) + 1)
+    self.ids[row] = entity_id
+    self.active[row] = True
+    self.seeking[row] = bool(seeking)
+    self.city[row] = city
+    self.state[row] = state
+    self.genres[row] = 0
+    self.genres[row, genres] = 1
+    self.genre_counts[row] = len(genres)
+
+  def remove(self, entity_id):
+    row = self.rows.get(entity_id)
+    if row is not None:
+      self.active[row] = False
+
+
+class Matchmaker(object):
+  """Venue and artist feature arrays and the co-booking counts of the pairs"""
+
+  seeking = {Venue: 'seeking_talent', Artist: 'seeking_venue'}
+
+  def __init__(self, ttl):
+    self._lock = threading.Lock()
+    self._sides = None
+    self._genres = {}
+    self._places = {}
+    self._history = {Venue: {}, Artist: {}}
+    self.expiry = Expiry(ttl)
+
+  def _code(self, key):
+    """Location code of key, 0 being unknown"""
+    if not all(key):
+      return 0
+    return self._places.setdefault(key, len(self._places) + 1)
+
+  def _set(self, side, model, row):
+    genres = [self._genres.setdefault(genre, len(self._genres)) for genre in set(row.genres or [])]
+    city, state = _place(row.city), _place(row.state)
+    side.set(row.id, genres, self._code((city, state)), self._code((state,)), getattr(row, self.seeking[model]))
+
+  def _columns(self, model):
+    return (model.id, model.genres, model.city, model.state, getattr(model, self.seeking[model]))
+
+  def _load(self):
+    if self._sides is None or self.expiry.expired():
+      self._genres = {}
+      self._places = {}
+      self._history = {Venue: {}, Artist: {}}
+      sides = {}
+      for model in (Venue, Artist):
+        sides[model] = Side()
+        for row in db.session.query(*self._columns(model)).yield_per(1000):
+          self._set(sides[model], model, row)
+      rows = db.session.query(Show.venue_id, Show.artist_id, db.func.count(Show.id)).group_by(Show.venue_id, Show.artist_id)
+      for venue_id, artist_id, count in rows:
+        self._history[Venue].setdefault(venue_id, {})[artist_id] = count
+        self._history[Artist].setdefault(artist_id, {})[venue_id] = count
+      self._sides = sides
+      self.expiry.loaded()
+    return self._sides
+
+  def recommend(self, model, entity_id, limit):
+    """Return up to limit (id, score) of the other model matching entity_id
+    of model, best first, or None when there is no such entity"""
+    other = Artist if model is Venue else Venue
+    with self._lock:
+      sides = self._load()
+      source, candidates = sides[model], sides[other]
+      row = source.rows.get(entity_id)
+      if row is None or not source.active[row]:
+        return None
+      size = candidates.size
+      if not size:
+        return []
+      width = min(source.genres.shape[1], candidates.genres.shape[1])
+      overlap = candidates.genres[:size, :width].dot(source.genres[row, :width])
+      union = candidates.genre_counts[:size] + source.genre_counts[row] - overlap
+      genres = np.divide(overlap, union, out=np.zeros(size, dtype=np.float32), where=union > 0)
+
+      location = np.zeros(size, dtype=np.float32)
+      if source.state[row]:
+        location[candidates.state[:size] == source.state[row]] = SAME_STATE
+      if source.city[row]:
+        location[candidates.city[:size] == source.city[row]] = 1
+
+      history = np.zeros(size, dtype=np.float32)
+      booked = self._history[model].get(entity_id, {})
+      pairs = [(candidates.rows[candidate_id], count) for candidate_id, count in booked.items() if candidate_id in candidates.rows]
+      if pairs:
+        rows, counts = zip(*pairs)
+        history[list(rows)] = np.log1p(counts)
+        history /= history.max()
+
+      scores = (
+        WEIGHTS['genres'] * genres
+        + WEIGHTS['location'] * location
+        + WEIGHTS['history'] * history
+        + WEIGHTS['seeking'] * candidates.seeking[:size]
+      )
+      scores[~candidates.active[:size]] = 0
+      k = min(limit, size)
+      best = np.argpartition(-scores, k - 1)[:k]
+      best = best[np.argsort(-scores[best], kind='stable')]
+      return [(int(candidates.ids[i]), round(float(scores[i]), 4)) for i in best if scores[i] > 0]
+
+  def refresh(self, model, entity_id):
+    """Pick up a created, edited or deleted venue or artist"""
+    with self._lock:
+      if self._sides is None:
+        return
+      row = db.session.query(*self._columns(model)).filter(model.id == entity_id).first()
+      if row is not None:
+        self._set(self._sides[model], model, row)
+        return
+      self._sides[model].remove(entity_id)
+      other = Artist if model is Venue else Venue
+      for other_id in self._history[model].pop(entity_id, {}):
+        self._history[other].get(other_id, {}).pop(entity_id, None)
+
+  def refresh_history(self, shows):
+    """Recount the bookings of created or deleted (venue_id, artist_id) shows"""
+    with self._lock:
+      if self._sides is None or not shows:
+        return
+      pairs = set(shows)
+      counts = dict.fromkeys(pairs, 0)
+      rows = db.session.query(Show.venue_id, Show.artist_id, db.func.count(Show.id)).filter(
+        Show.venue_id.in_(set(venue_id for venue_id, _ in pairs)),
+        Show.artist_id.in_(set(artist_id for _, artist_id in pairs))
+      ).group_by(Show.venue_id, Show.artist_id)
+      for venue_id, artist_id, count in rows:
+        if (venue_id, artist_id) in counts:
+          counts[(venue_id, artist_id)] = count
+      for (venue_id, artist_id), count in counts.items():
+        if count:
+          self._history[Venue].setdefault(venue_id, {})[artist_id] = count
+          self._history[Artist].setdefault(artist_id, {})[venue_id] = count
+        else:
+          self._history[Venue].get(venue_id, {}).pop(artist_id, None)
+          self._history[Artist].get(artist_id, {}).pop(venue_id, None)
+
+
+def get_matchmaker():
+  """Return the matchmaker of the current app, creating it on first use"""
+  matchmaker = current_app.extensions.get('fyyur_matchmaker')
+  if matchmaker is None:
+    matchmaker = current_app.extensions['fyyur_matchmaker'] = Matchmaker(current_app.config['MATCH_TTL'])
+  return matchmaker
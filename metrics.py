@@ -0,0 +1,285 @@
+import hmac
+import logging
+import threading
+import time
+from collections import deque
+from flask import g, jsonify, request, current_app, has_app_context, has_request_context, abort, Response
+from flask import signals_available, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from models import db
+
+#----------------------------------------------------------------------------#
+# Metrics.
+#
+# Connection pool: the engine uses InstrumentedQueuePool, which times every
+# checkout and records the checkouts that had to wait for a connection
+# because the pool and its overflow were exhausted.
+#
+# Requests: every SQL statement and template render is timed and added to the
+# stats of the current request. Statements slower than SLOW_QUERY_THRESHOLD_MS
+# are logged with their route to the fyyur.slow_query logger. In debug mode
+# responses carry X-Query-Count and Server-Timing headers.
+#
+# Both are served as JSON at /metrics to requests carrying the
+# METRICS_TOKEN (the route does not exist while it is unset). Numbers are
+# per worker process.
+#----------------------------------------------------------------------------#
+
+slow_query_logger = logging.getLogger('fyyur.slow_query')
+
+# Engine options that only apply to QueuePool; SQLite uses other pools
+QUEUE_POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
+
+
+def percentiles(samples, points=(50, 95, 99)):
+  """Return {'p50': ..., ...} of a list of samples, nearest rank"""
+  ordered = sorted(samples)
+  result = {}
+  for point in points:
+    if ordered:
+      rank = max(0, int(round(point / 100.0 * len(ordered))) - 1)
+      result['p%d' % point] = ordered[rank]
+    else:
+      result['p%d' % point] = None
+  return result
+
+
+class PoolStats(object):
+  """Checkout counters plus a window of the latest checkout latencies"""
+
+  def __init__(self, window=1024):
+    self._lock = threading.Lock()
+    self.checkouts = 0
+    self.waits = 0
+    self.wait_time = 0.0
+    self.max_wait_time = 0.0
+    self.timeouts = 0
+    self._latencies = deque(maxlen=window)
+
+  def record(self, elapsed, waited, timed_out=False):
+    with self._lock:
+      if timed_out:
+        self.timeouts += 1
+      else:
+        self.checkouts += 1
+        self._latencies.append(elapsed)
+      if waited:
+        self.waits += 1
+        self.wait_time += elapsed
+        self.max_wait_time = max(self.max_wait_time, elapsed)
+
+  def snapshot(self):
+    with self._lock:
+      latencies_ms = [latency * 1000 for latency in self._latencies]
+      return {
+        'checkouts': self.checkouts,
+        'checkout_latency_ms': percentiles(latencies_ms),
+        'waits': self.waits,
+        'wait_time_ms': {
+          'total': self.wait_time * 1000,
+          'max': self.max_wait_time * 1000
+        },
+        'timeouts': self.timeouts
+      }
+
+
+class InstrumentedQueuePool(QueuePool):
+  """QueuePool that records checkout latency and time spent waiting"""
+
+  def __init__(self, *args, **kwargs):
+    super(InstrumentedQueuePool, self).__init__(*args, **kwargs)
+    self.stats = PoolStats()
+
+  def _exhausted(self):
+    if self._max_overflow < 0:
+      return False
+    return self.checkedout() >= self.size() + self._max_overflow
+
+  def _do_get(self):
+    waited = self._exhausted()
+    started = time.perf_counter()
+    try:
+      connection = super(InstrumentedQueuePool, self)._do_get()
+    except Exception:
+      self.stats.record(time.perf_counter() - started, waited, timed_out=True)
+      raise
+    self.stats.record(time.perf_counter() - started, waited)
+    return connection
+
+
+def pool_metrics():
+  """Return the live gauges and the checkout statistics of the engine pool"""
+  pool = db.engine.pool
+  metrics = {'class': type(pool).__name__}
+  if isinstance(pool, QueuePool):
+    metrics.update({
+      'size': pool.size(),
+      'checked_in': pool.checkedin(),
+      'checked_out': pool.checkedout(),
+      'overflow': pool.overflow(),
+      'max_overflow': pool._max_overflow,
+      'timeout': pool.timeout()
+    })
+  stats = getattr(pool, 'stats', None)
+  if stats is not None:
+    metrics.update(stats.snapshot())
+  return metrics
+
+
+class RequestStats(object):
+  """SQL and template timings of the request being handled"""
+
+  def __init__(self):
+    self.started = time.perf_counter()
+    self.queries = 0
+    self.db_time = 0.0
+    self.template_time = 0.0
+    self._templates = []
+
+  def merge(self, other):
+    """Add the queries and timings of other, e.g. of a call run by concurrency.gather()"""
+    self.queries += other.queries
+    self.db_time += other.db_time
+    self.template_time += other.template_time
+
+
+class RouteStats(object):
+  """Per endpoint aggregates of the RequestStats of finished requests"""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._routes = {}
+
+  def record(self, endpoint, stats, total):
+    with self._lock:
+      route = self._routes.setdefault(endpoint, {
+        'requests': 0, 'queries': 0, 'max_queries': 0,
+        'db_time': 0.0, 'template_time': 0.0, 'total_time': 0.0
+      })
+      route['requests'] += 1
+      route['queries'] += stats.queries
+      route['max_queries'] = max(route['max_queries'], stats.queries)
+      route['db_time'] += stats.db_time
+      route['template_time'] += stats.template_time
+      route['total_time'] += total
+
+  def snapshot(self):
+    with self._lock:
+      routes = {}
+      for endpoint, route in self._routes.items():
+        requests = float(route['requests'])
+        routes[endpoint] = {
+          'requests': route['requests'],
+          'queries_per_request': route['queries'] / requests,
+          'max_queries': route['max_queries'],
+          'db_ms_per_request': route['db_time'] * 1000 / requests,
+          'template_ms_per_request': route['template_time'] * 1000 / requests,
+          'total_ms_per_request': route['total_time'] * 1000 / requests
+        }
+      return routes
+
+
+route_stats = RouteStats()
+
+
+def current_request_stats():
+  """Return the RequestStats of the current request, or None outside of one"""
+  if not has_request_context():
+    return None
+  return g.get('fyyur_request_stats')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  """Start times are kept per cursor: a statement that raises gets no
+  after_cursor_execute, its entry is dropped by _handle_error"""
+  conn.info.setdefault('fyyur_query_started', {})[cursor] = time.perf_counter()
+
+
+def _handle_error(exception_context):
+  connection = exception_context.connection
+  cursor = exception_context.cursor or getattr(exception_context.execution_context, 'cursor', None)
+  if connection is not None and cursor is not None:
+    connection.info.get('fyyur_query_started', {}).pop(cursor, None)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  started = conn.info.get('fyyur_query_started', {}).pop(cursor, None)
+  if started is None:
+    return
+  elapsed = time.perf_counter() - started
+  stats = current_request_stats()
+  if stats is not None:
+    stats.queries += 1
+    stats.db_time += elapsed
+  if has_app_context() and elapsed * 1000 >= current_app.config.get('SLOW_QUERY_THRESHOLD_MS', 100):
+    route = request.endpoint if has_request_context() else '-'
+    slow_query_logger.warning('Slow query (%.1f ms) in %s: %s', elapsed * 1000, route, statement)
+
+
+def _before_render_template(app, template, context, **extra):
+  stats = current_request_stats()
+  if stats is not None:
+    stats._templates.append(time.perf_counter())
+
+
+def _template_rendered(app, template, context, **extra):
+  stats = current_request_stats()
+  if stats is not None and stats._templates:
+    elapsed = time.perf_counter() - stats._templates.pop()
+    """Only count the outermost template, includes render inside it"""
+    if not stats._templates:
+      stats.template_time += elapsed
+
+
+_engine_listeners_installed = False
+
+
+def init_app(app):
+  """Configure the engine pool of app, instrument its requests and serve /metrics"""
+  global _engine_listeners_installed
+  options = app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+  if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    for option in QUEUE_POOL_OPTIONS:
+      options.pop(option, None)
+  else:
+    options.setdefault('poolclass', InstrumentedQueuePool)
+
+  if not _engine_listeners_installed:
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+    _engine_listeners_installed = True
+  if signals_available:
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
+
+  @app.before_request
+  def start_request_stats():
+    g.fyyur_request_stats = RequestStats()
+
+  @app.after_request
+  def finish_request_stats(response):
+    stats = g.get('fyyur_request_stats')
+    if stats is None:
+      return response
+    total = time.perf_counter() - stats.started
+    route_stats.record(request.endpoint or '-', stats, total)
+    if app.debug:
+      response.headers['X-Query-Count'] = str(stats.queries)
+      response.headers['Server-Timing'] = 'db;dur={:.1f};desc="{} queries", tpl;dur={:.1f}, total;dur={:.1f}'.format(
+        stats.db_time * 1000, stats.queries, stats.template_time * 1000, total * 1000
+      )
+    return response
+
+  def metrics_view():
+    """Requires an `Authorization: Bearer <METRICS_TOKEN>` header"""
+    token = app.config.get('METRICS_TOKEN')
+    if not token:
+      abort(404)
+    authorization = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(authorization.encode('utf-8'), ('Bearer ' + token).encode('utf-8')):
+      return Response('Unauthorized\n', 401, {'WWW-Authenticate': 'Bearer'})
+    return jsonify({'pool': pool_metrics(), 'routes': route_stats.snapshot()})
+  app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,26 @@
+"""empty message
+
+Revision ID: c3a8e5f1d264
+Revises: b47f0d2e9c31
+Create Date: 2020-01-15 09:48:03.114527
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a8e5f1d264'
+down_revision = 'b47f0d2e9c31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Serves the grouping and keyset of the /venues areas, which coalesce
+    # NULL cities and states to '' (see models.AREA_STATE and AREA_CITY)
+    op.create_index('ix_Venue_area', 'Venue', [sa.text("coalesce(state, '')"), sa.text("coalesce(city, '')")], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_area', table_name='Venue')
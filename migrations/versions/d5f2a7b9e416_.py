@@ -0,0 +1,48 @@
+"""empty message
+
+Revision ID: d5f2a7b9e416
+Revises: c3a8e5f1d264
+Create Date: 2020-01-15 14:26:51.370842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5f2a7b9e416'
+down_revision = 'c3a8e5f1d264'
+branch_labels = None
+depends_on = None
+
+COUNTERS = '''
+UPDATE "{table}" SET
+    past_shows_count = past_shows_count - (
+        SELECT count(*) FROM "Show"
+        WHERE "Show".{foreign_key} = "{table}".id AND "Show".start_time IS NULL AND "Show".counted_as_past
+    ),
+    upcoming_shows_count = upcoming_shows_count - (
+        SELECT count(*) FROM "Show"
+        WHERE "Show".{foreign_key} = "{table}".id AND "Show".start_time IS NULL AND NOT "Show".counted_as_past
+    ),
+    version = version + 1
+WHERE id IN (SELECT {foreign_key} FROM "Show" WHERE start_time IS NULL)
+'''
+
+
+def upgrade():
+    # Shows without a start time were on no page (the listings page on
+    # start_time) and cannot be booked any more; take them off the counters
+    # and delete them before making the column NOT NULL
+    op.execute(COUNTERS.format(table='Venue', foreign_key='venue_id'))
+    op.execute(COUNTERS.format(table='Artist', foreign_key='artist_id'))
+    op.execute('DELETE FROM "Show" WHERE start_time IS NULL')
+    op.alter_column('Show', 'start_time',
+               existing_type=sa.DateTime(timezone=True),
+               nullable=False)
+
+
+def downgrade():
+    op.alter_column('Show', 'start_time',
+               existing_type=sa.DateTime(timezone=True),
+               nullable=True)
@@ -0,0 +1,35 @@
+"""empty message
+
+Revision ID: e7d04b5a96c1
+Revises: c84b6d21f3e9
+Create Date: 2020-01-08 11:05:19.870213
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7d04b5a96c1'
+down_revision = 'c84b6d21f3e9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # array_to_string() is only STABLE, wrap it in an IMMUTABLE function so the
+    # searchable text of a row can be indexed
+    op.execute("""
+        CREATE OR REPLACE FUNCTION fyyur_search_text(name text, city text, genres text[])
+        RETURNS text LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT lower(coalesce(name, '') || ' ' || coalesce(city, '') || ' ' || coalesce(array_to_string(genres, ' '), ''))
+        $$
+    """)
+    op.execute('CREATE INDEX "ix_Venue_search_trgm" ON "Venue" USING gin (fyyur_search_text(name, city, genres) gin_trgm_ops)')
+    op.execute('CREATE INDEX "ix_Artist_search_trgm" ON "Artist" USING gin (fyyur_search_text(name, city, genres) gin_trgm_ops)')
+
+
+def downgrade():
+    op.drop_index('ix_Artist_search_trgm', table_name='Artist')
+    op.drop_index('ix_Venue_search_trgm', table_name='Venue')
+    op.execute('DROP FUNCTION fyyur_search_text(text, text, text[])')
@@ -3,48 +3,112 @@ from datetime import datetime
 
 db = SQLAlchemy()
 
+# Genres are a PostgreSQL text[]; SQLite (used for local benchmark and test
+# runs) has no array type, so they are stored as JSON there.
+Genres = db.ARRAY(db.String).with_variant(db.JSON(), 'sqlite')
+
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+class Location(db.Model):
+    __tablename__ = 'Location'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Case folded, whitespace collapsed city and state, see locations.py
+    key = db.Column(db.String(250), nullable=False, unique=True)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    # GIN index serving the ?genre= filter of /venues, see genres.py; the
+    # area index serves the grouping and keyset of the /venues listing, which
+    # must use the very same expressions (see AREA_STATE and AREA_CITY)
+    __table_args__ = (
+        db.Index('ix_Venue_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_Venue_area', db.text("coalesce(state, '')"), db.text("coalesce(city, '')")),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
-    genres = db.Column(db.ARRAY(db.String))
+    genres = db.Column(Genres)
     address = db.Column(db.String(120))
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
+    # The Location of city and state, what "City, State" searches look up
+    location_id = db.Column(db.Integer, db.ForeignKey('Location.id'), index=True)
     phone = db.Column(db.String(120))
     website = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String)
     image_link = db.Column(db.String(500))
-    timestamp = db.Column(db.DateTime, default=datetime.now().replace(microsecond=0))
+    # Looked up in the gazetteer by city and state, see geo.py; on PostgreSQL
+    # a GiST index over ll_to_earth(latitude, longitude) serves the nearby
+    # venues search (created by its migration)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    timestamp = db.Column(db.DateTime, default=lambda: datetime.now().replace(microsecond=0))
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Incremented by every update of the row, counters included; the ETags
+    # of the JSON API are derived from it (see api.py)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    shows = db.relationship('Show', backref='venue', lazy=True, order_by='Show.start_time', cascade='all, delete-orphan')
+
+# Area of a venue in the /venues listing, with NULLs as '' so the keyset
+# comparisons see every area; matches the ix_Venue_area index, hence the
+# literal rather than a bound ''
+AREA_STATE = db.func.coalesce(Venue.state, db.literal_column("''"))
+AREA_CITY = db.func.coalesce(Venue.city, db.literal_column("''"))
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    # See Venue.__table_args__
+    __table_args__ = (
+        db.Index('ix_Artist_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
-    genres = db.Column(db.ARRAY(db.String))
+    genres = db.Column(Genres)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
+    # See Venue.location_id
+    location_id = db.Column(db.Integer, db.ForeignKey('Location.id'), index=True)
     phone = db.Column(db.String(120))
     website = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String)
     image_link = db.Column(db.String(500))
-    timestamp = db.Column(db.DateTime, default=datetime.now().replace(microsecond=0))
-    shows = db.relationship('Show', backref='artist', lazy=True)
+    timestamp = db.Column(db.DateTime, default=lambda: datetime.now().replace(microsecond=0))
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # See Venue.version
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    shows = db.relationship('Show', backref='artist', lazy=True, order_by='Show.start_time')
 
 class Show(db.Model):
   __tablename__ = 'Show'
+  __table_args__ = (
+    db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+    db.Index('ix_Show_start_time_not_counted_as_past', 'start_time', postgresql_where=db.text('NOT counted_as_past')),
+  )
 
   id = db.Column(db.Integer, primary_key=True)
   artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
-  venue_id = db.Column(db.Integer)
-  start_time = db.Column(db.String(120))
\ No newline at end of file
+  venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+  # Required: the listings and their keyset cursors order on it
+  start_time = db.Column(db.DateTime(timezone=True), nullable=False)
+  # Shows of a venue or an artist cannot overlap (see conflicts.py and the
+  # exclusion constraints of migration 0b6e3f9a2c58); shows without an
+  # end_time are not checked
+  end_time = db.Column(db.DateTime(timezone=True))
+  # Whether the show is included in the past_shows_count of its venue and
+  # artist (see counters.py) rather than in their upcoming_shows_count
+  counted_as_past = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+  # See Venue.version
+  version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
\ No newline at end of file
@@ -0,0 +1,104 @@
+import base64
+import json
+from collections import namedtuple
+from flask import request, abort
+from sqlalchemy import and_, or_
+
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#----------------------------------------------------------------------------#
+
+Page = namedtuple('Page', ['items', 'prev_cursor', 'next_cursor'])
+
+
+def encode_cursor(values):
+  """Encode the sort key of a row as an opaque, url safe cursor"""
+  raw = json.dumps(list(values), default=str, separators=(',', ':'))
+  return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, *parsers):
+  """Decode a cursor created by encode_cursor, return None if it is malformed
+
+  Values are JSON encoded, so non JSON types (e.g. datetimes) come back as
+  strings; pass one parser per value to restore their types.
+  """
+  if not cursor:
+    return None
+  try:
+    padded = cursor + '=' * (-len(cursor) % 4)
+    values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    if not isinstance(values, list):
+      return None
+    if parsers:
+      if len(parsers) != len(values):
+        return None
+      values = [parse(value) for parse, value in zip(parsers, values)]
+  except (ValueError, TypeError, OverflowError):
+    return None
+  return values
+
+
+def cursor_arg(name, *parsers):
+  """Return the ?after= or ?before= cursor of the request decoded with one
+  parser per sort column, or None when it is not given; a malformed cursor
+  is answered with a 400 rather than silently serving the first page"""
+  cursor = request.args.get(name)
+  if not cursor:
+    return None
+  values = decode_cursor(cursor, *parsers)
+  if values is None:
+    abort(400, 'Invalid {} cursor.'.format(name))
+  return values
+
+
+def _seek(columns, values, forward):
+  """Build the row comparison (c1, c2, ...) > (v1, v2, ...) as nested OR/AND
+
+  Spelled out instead of using tuple_() so the same clause works on SQLite.
+  The redundant c1 >= v1 in front gives the planner a range on the leading
+  column of the index, which it cannot derive from the OR.
+  """
+  column, value = columns[0], values[0]
+  past = column > value if forward else column < value
+  if len(columns) == 1:
+    return past
+  bound = column >= value if forward else column <= value
+  return and_(bound, or_(past, and_(column == value, _seek(columns[1:], values[1:], forward))))
+
+
+def keyset_page(query, columns, key, per_page, after=None, before=None):
+  """Return one page of query ordered by columns, seeking past a cursor
+
+  columns is the unique, ascending sort key (e.g. start_time, id) and key
+  extracts the same values from a result row. Only one of after/before should
+  be given; they are the decoded cursors of the neighbouring pages. Deep pages
+  cost the same as the first one because the database seeks on the index
+  instead of skipping OFFSET rows.
+  """
+  if after is not None and len(after) != len(columns):
+    after = None
+  if before is not None and len(before) != len(columns):
+    before = None
+  backwards = before is not None and after is None
+  if backwards:
+    query = query.filter(_seek(columns, before, forward=False))
+    query = query.order_by(*[column.desc() for column in columns])
+  else:
+    if after is not None:
+      query = query.filter(_seek(columns, after, forward=True))
+    query = query.order_by(*columns)
+
+  rows = query.limit(per_page + 1).all()
+  has_more = len(rows) > per_page
+  rows = rows[:per_page]
+
+  if backwards:
+    rows.reverse()
+    has_prev, has_next = has_more, True
+  else:
+    has_prev, has_next = after is not None, has_more
+
+  prev_cursor = encode_cursor(key(rows[0])) if rows and has_prev else None
+  next_cursor = encode_cursor(key(rows[-1])) if rows and has_next else None
+  return Page(rows, prev_cursor, next_cursor)
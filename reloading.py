@@ -0,0 +1,34 @@
+import time
+
+#----------------------------------------------------------------------------#
+# Reloading in-process structures.
+#
+# Some lookups are served from the memory of each worker process: the home
+# page feeds (latest.py), the typeahead index (typeahead.py), the
+# matchmaking arrays (matchmaking.py) and the in-process fallbacks of the
+# search, genre and geo backends. Each is loaded from the database on first
+# use and then updated in place by the writes its own worker handles.
+# Writes handled by another worker, or by a `flask fyyur` command, never
+# reach it, so it is rebuilt once it is older than its TTL: the TTL bounds
+# how long a worker can serve results missing those writes.
+#----------------------------------------------------------------------------#
+
+class Expiry(object):
+  """Load time of an in-process structure, which is due for a reload ttl
+  seconds later"""
+
+  def __init__(self, ttl):
+    self.ttl = ttl
+    self._loaded_at = None
+
+  def expired(self):
+    """Whether the structure was never loaded, or was loaded over ttl seconds ago"""
+    return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+  def loaded(self):
+    """Record that the structure was just (re)loaded"""
+    self._loaded_at = time.monotonic()
+
+  def expire(self):
+    """Make the next use reload the structure"""
+    self._loaded_at = None
@@ -0,0 +1,174 @@
+import threading
+from collections import namedtuple
+from flask import current_app
+from models import db
+from reloading import Expiry
+
+#----------------------------------------------------------------------------#
+# Search backends.
+#
+# Venues and artists are searched on their name, city and genres. On
+# PostgreSQL the match runs against a pg_trgm GIN index over the
+# fyyur_search_text(name, city, genres) expression (see the migration that
+# creates it). Other databases, e.g. SQLite in test runs, use an in-process
+# trigram index that is built on first use, kept up to date through
+# refresh() and rebuilt SEARCH_INDEX_TTL seconds after loading it (see
+# reloading.py). Pick one with the SEARCH_BACKEND setting, which
+# select_backend() also applies to the genre and geo backends.
+#----------------------------------------------------------------------------#
+
+SearchResult = namedtuple('SearchResult', ['id', 'name'])
+
+
+def normalize(text):
+  """Lower case text and collapse its whitespace"""
+  return ' '.join((text or '').split()).lower()
+
+
+def trigrams(text):
+  """Return the set of trigrams of text, padded the way pg_trgm pads words"""
+  grams = set()
+  for word in normalize(text).split(' '):
+    if not word:
+      continue
+    padded = '  ' + word + ' '
+    for i in range(len(padded) - 2):
+      grams.add(padded[i:i + 3])
+  return grams
+
+
+def similarity(a, b):
+  """Share of trigrams two trigram sets have in common, like pg_trgm similarity()"""
+  if not a or not b:
+    return 0.0
+  return len(a & b) / float(len(a | b))
+
+
+class SearchBackend(object):
+  """Base class of the search backends"""
+
+  def search(self, model, term, limit):
+    """Return up to limit SearchResults of model matching term, best first"""
+    raise NotImplementedError
+
+  def refresh(self, model, entity_id):
+    """Pick up a created, edited or deleted entity"""
+    pass
+
+
+class PostgresSearchBackend(SearchBackend):
+  """Ranked substring search served by the pg_trgm GIN indexes"""
+
+  def search(self, model, term, limit):
+    term = normalize(term)
+    pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    document = db.func.fyyur_search_text(model.name, model.city, model.genres)
+    rows = db.session.query(model.id, model.name).filter(
+      document.ilike(pattern, escape='\\')
+    ).order_by(
+      db.func.similarity(model.name, term).desc(),
+      model.name
+    ).limit(limit).all()
+    return [SearchResult(row.id, row.name) for row in rows]
+
+
+class MemorySearchBackend(SearchBackend):
+  """In-process trigram index, the fallback for databases without pg_trgm
+
+  Holds a {trigram: set of ids} posting list per model. A search intersects
+  the postings of the term's trigrams, starting with the rarest, and only
+  verifies the remaining candidates.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._indexes = {}
+    self.expiry = Expiry(current_app.config['SEARCH_INDEX_TTL'])
+
+  def _document(self, row):
+    return normalize(' '.join([row.name or '', row.city or ''] + list(row.genres or [])))
+
+  def _index(self, model):
+    if self.expiry.expired():
+      self._indexes = {}
+      self.expiry.loaded()
+    index = self._indexes.get(model)
+    if index is None:
+      index = {'documents': {}, 'postings': {}}
+      rows = db.session.query(model.id, model.name, model.city, model.genres).yield_per(1000)
+      for row in rows:
+        self._add(index, row)
+      self._indexes[model] = index
+    return index
+
+  def _add(self, index, row):
+    document = self._document(row)
+    index['documents'][row.id] = (document, row.name, trigrams(row.name))
+    for gram in trigrams(document):
+      index['postings'].setdefault(gram, set()).add(row.id)
+
+  def _remove(self, index, entity_id):
+    entry = index['documents'].pop(entity_id, None)
+    if entry is None:
+      return
+    for gram in trigrams(entry[0]):
+      ids = index['postings'].get(gram)
+      if ids is not None:
+        ids.discard(entity_id)
+        if not ids:
+          del index['postings'][gram]
+
+  def search(self, model, term, limit):
+    term = normalize(term)
+    with self._lock:
+      index = self._index(model)
+      documents = index['documents']
+      """Only trigrams inside a word are implied by a substring match"""
+      grams = [gram for gram in trigrams(term) if ' ' not in gram]
+      if not grams:
+        candidates = documents.keys()
+      else:
+        postings = sorted((index['postings'].get(gram, set()) for gram in grams), key=len)
+        candidates = set.intersection(*postings)
+      term_grams = trigrams(term)
+      matches = [
+        (similarity(documents[entity_id][2], term_grams), documents[entity_id][1] or '', entity_id)
+        for entity_id in candidates
+        if term in documents[entity_id][0]
+      ]
+    matches.sort(key=lambda match: (-match[0], match[1]))
+    return [SearchResult(entity_id, name) for _, name, entity_id in matches[:limit]]
+
+  def refresh(self, model, entity_id):
+    with self._lock:
+      index = self._indexes.get(model)
+      if index is None:
+        return
+      self._remove(index, entity_id)
+      row = db.session.query(model.id, model.name, model.city, model.genres).filter(model.id == entity_id).first()
+      if row is not None:
+        self._add(index, row)
+
+
+BACKENDS = {
+  'postgres': PostgresSearchBackend,
+  'memory': MemorySearchBackend
+}
+
+
+def select_backend(extension, backends):
+  """Return the backend of the current app stored under extension, creating
+  it on first use from backends ({'postgres': class, 'memory': class}) as
+  SEARCH_BACKEND says; 'auto' picks by database"""
+  backend = current_app.extensions.get(extension)
+  if backend is None:
+    name = current_app.config.get('SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+      name = 'postgres' if db.engine.dialect.name == 'postgresql' else 'memory'
+    backend = current_app.extensions[extension] = backends[name]()
+  return backend
+
+
+def get_backend():
+  """Return the search backend of the current app, creating it on first use"""
+  return select_backend('fyyur_search', BACKENDS)
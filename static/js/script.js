@@ -2,3 +2,50 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Typeahead for the navbar search boxes: suggests venues or artists from
+// /api/search as the user types and links straight to their page.
+document.querySelectorAll('input[data-typeahead]').forEach(function(input) {
+  var kind = input.dataset.typeahead;
+  var menu = document.createElement('ul');
+  var timer = null;
+  menu.className = 'dropdown-menu typeahead';
+  input.parentNode.style.position = 'relative';
+  input.parentNode.appendChild(menu);
+
+  function render(items) {
+    menu.innerHTML = '';
+    items.forEach(function(item) {
+      var li = document.createElement('li');
+      var a = document.createElement('a');
+      a.href = '/' + kind + '/' + item.id;
+      a.textContent = item.name;
+      li.appendChild(a);
+      menu.appendChild(li);
+    });
+    menu.style.display = items.length ? 'block' : 'none';
+  }
+
+  input.addEventListener('input', function() {
+    clearTimeout(timer);
+    var q = input.value.trim();
+    if (!q || q.indexOf(',') !== -1) {
+      render([]);
+      return;
+    }
+    timer = setTimeout(function() {
+      fetch('/api/search?q=' + encodeURIComponent(q))
+        .then(function(response) { return response.json(); })
+        .then(function(results) {
+          if (input.value.trim() === q) {
+            render(results[kind]);
+          }
+        })
+        .catch(function() { render([]); });
+    }, 150);
+  });
+
+  input.addEventListener('blur', function() {
+    setTimeout(function() { render([]); }, 200);
+  });
+});
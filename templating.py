@@ -0,0 +1,83 @@
+import os
+import stat
+import tempfile
+from jinja2 import FileSystemBytecodeCache
+
+#----------------------------------------------------------------------------#
+# Template compilation.
+#
+# Jinja compiles a template to Python bytecode the first time a process uses
+# it. With a bytecode cache on disk every worker after the first one, and
+# every restart, loads the compiled code instead of compiling again, and
+# warm_up() compiles the page templates when the app starts rather than on
+# the first requests. With TEMPLATES_AUTO_RELOAD off (the default outside of
+# debug mode) Jinja no longer checks the template files for changes on
+# every render.
+#
+# Jinja loads the cached code as is, so the cache directory must not be
+# writable by anyone but the user the app runs as: it is created with mode
+# 0700, and an existing one owned by another user or writable by its group
+# or others (e.g. planted in /tmp by another local user) is not used.
+#----------------------------------------------------------------------------#
+
+# Template folders compiled by warm_up()
+WARM_UP_FOLDERS = ('pages/', 'forms/', 'layouts/', 'errors/')
+
+
+class AtomicFileSystemBytecodeCache(FileSystemBytecodeCache):
+  """FileSystemBytecodeCache whose files are replaced atomically, so workers
+  sharing the directory never read a file another one is writing"""
+
+  def dump_bytecode(self, bucket):
+    filename = self._get_cache_filename(bucket)
+    handle, temporary = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+    try:
+      with os.fdopen(handle, 'wb') as cache_file:
+        bucket.write_bytecode(cache_file)
+      os.replace(temporary, filename)
+    except OSError:
+      """The cache is an optimisation, rendering goes on without it"""
+      try:
+        os.remove(temporary)
+      except OSError:
+        pass
+
+
+def private_directory(directory):
+  """Create directory with mode 0700 if missing; return whether it is a
+  directory owned by this user that only this user can write to"""
+  try:
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    status = os.lstat(directory)
+  except OSError:
+    return False
+  if not stat.S_ISDIR(status.st_mode):
+    return False
+  if hasattr(os, 'getuid') and status.st_uid != os.getuid():
+    return False
+  return not status.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def warm_up(app):
+  """Compile the templates of WARM_UP_FOLDERS; returns their names"""
+  names = [
+    name for name in app.jinja_env.list_templates(extensions=['html'])
+    if name.startswith(WARM_UP_FOLDERS)
+  ]
+  for name in names:
+    app.jinja_env.get_template(name)
+  return names
+
+
+def init_app(app):
+  """Install the bytecode cache and, if TEMPLATE_WARM_UP is on, compile the templates"""
+  directory = app.config.get('TEMPLATE_CACHE_DIR')
+  if directory:
+    if private_directory(directory):
+      app.jinja_env.bytecode_cache = AtomicFileSystemBytecodeCache(directory, 'fyyur-%s.cache')
+    else:
+      app.logger.warning(
+        'Template cache disabled: %s is not a directory owned by this user and writable only by it', directory
+      )
+  if app.config.get('TEMPLATE_WARM_UP'):
+    warm_up(app)
@@ -0,0 +1,147 @@
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from flask import current_app
+from models import db, Venue, Artist
+from search import normalize
+from reloading import Expiry
+
+#----------------------------------------------------------------------------#
+# Typeahead.
+#
+# As-you-type search over venue and artist names. Every name is indexed under
+# each of its word suffixes ("the musical hop", "musical hop", "hop") in a
+# sorted array, so any prefix of any word is found with one bisect. The index
+# is built from the database on first use, updated in place on create, edit
+# and delete, and hot prefixes are answered from an LRU cache that is
+# cleared whenever the index changes. Every worker keeps its own index,
+# rebuilt TYPEAHEAD_TTL seconds after loading it (see reloading.py).
+#----------------------------------------------------------------------------#
+
+def word_suffixes(name):
+  """Return the keys a name is indexed under"""
+  words = normalize(name).split(' ')
+  return set(' '.join(words[i:]) for i in range(len(words)) if words[i])
+
+
+class PrefixIndex(object):
+  """Sorted array of (key, id) pairs searched with bisect"""
+
+  def __init__(self):
+    self._keys = []
+    self._names = {}
+
+  def load(self, rows):
+    """Bulk load (id, name) rows, sorting once instead of inserting one by one"""
+    for entity_id, name in rows:
+      self._names[entity_id] = name
+      self._keys.extend((key, entity_id) for key in word_suffixes(name))
+    self._keys.sort()
+
+  def add(self, entity_id, name):
+    self.remove(entity_id)
+    self._names[entity_id] = name
+    for key in word_suffixes(name):
+      insort(self._keys, (key, entity_id))
+
+  def remove(self, entity_id):
+    name = self._names.pop(entity_id, None)
+    if name is None:
+      return
+    for key in word_suffixes(name):
+      i = bisect_left(self._keys, (key, entity_id))
+      if i < len(self._keys) and self._keys[i] == (key, entity_id):
+        del self._keys[i]
+
+  def search(self, prefix, limit):
+    """Return up to limit (id, name) pairs with a word starting with prefix
+
+    Names that start with the prefix come before names that only contain a
+    word starting with it. At most a few times limit candidates are looked at,
+    so very short prefixes stay cheap.
+    """
+    prefix = normalize(prefix)
+    if not prefix:
+      return []
+    leading = []
+    inner = []
+    seen = set()
+    i = bisect_left(self._keys, (prefix,))
+    while i < len(self._keys) and len(seen) < limit * 4:
+      key, entity_id = self._keys[i]
+      if not key.startswith(prefix):
+        break
+      if entity_id not in seen:
+        seen.add(entity_id)
+        name = self._names[entity_id]
+        if normalize(name).startswith(prefix):
+          leading.append((entity_id, name))
+        else:
+          inner.append((entity_id, name))
+      i += 1
+    return (leading + inner)[:limit]
+
+
+class Typeahead(object):
+  """Prefix indexes of venue and artist names with a result cache"""
+
+  models = {'venues': Venue, 'artists': Artist}
+
+  def __init__(self, cache_size, ttl):
+    self._lock = threading.Lock()
+    self._indexes = None
+    self._cache = OrderedDict()
+    self._cache_size = cache_size
+    self.expiry = Expiry(ttl)
+
+  def _load(self):
+    if self._indexes is None or self.expiry.expired():
+      indexes = {}
+      for kind, model in self.models.items():
+        indexes[kind] = PrefixIndex()
+        indexes[kind].load(db.session.query(model.id, model.name).yield_per(1000))
+      self._indexes = indexes
+      self.expiry.loaded()
+      self._cache.clear()
+    return self._indexes
+
+  def search(self, prefix, limit):
+    """Return {'venues': [...], 'artists': [...]} for a typed prefix"""
+    key = (normalize(prefix), limit)
+    with self._lock:
+      indexes = self._load()
+      results = self._cache.get(key)
+      if results is not None:
+        self._cache.move_to_end(key)
+        return results
+      results = {}
+      for kind, index in indexes.items():
+        results[kind] = [{'id': entity_id, 'name': name} for entity_id, name in index.search(key[0], limit)]
+      self._cache[key] = results
+      if len(self._cache) > self._cache_size:
+        self._cache.popitem(last=False)
+      return results
+
+  def refresh(self, model, entity_id):
+    """Pick up a created, edited or deleted venue or artist"""
+    with self._lock:
+      if self._indexes is None:
+        return
+      kind = 'venues' if model is Venue else 'artists'
+      name = db.session.query(model.name).filter(model.id == entity_id).scalar()
+      if name is None:
+        self._indexes[kind].remove(entity_id)
+      else:
+        self._indexes[kind].add(entity_id, name)
+      self._cache.clear()
+
+
+def get_typeahead():
+  """Return the typeahead index of the current app, creating it on first use"""
+  typeahead = current_app.extensions.get('fyyur_typeahead')
+  if typeahead is None:
+    typeahead = current_app.extensions['fyyur_typeahead'] = Typeahead(
+      current_app.config['TYPEAHEAD_CACHE_SIZE'],
+      current_app.config['TYPEAHEAD_TTL']
+    )
+  return typeahead